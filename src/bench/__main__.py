@@ -0,0 +1,237 @@
+import argparse
+from collections import deque
+import socket
+from threading import Thread
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from wsproto import WSConnection
+from wsproto.connection import ConnectionType
+from wsproto.events import Request
+
+import constants
+from bench.chat_load import ChatLoadGenerator, StubEmoteManager
+from twitch.credentials import Credentials
+from twitch.events import EventTypes
+from twitch.message import TwitchMessageNotification
+from widget.broadcast import ComboBroadcaster
+from widget.combo import ComboManager
+from widget.widget_comm import CommServer, Topic
+
+
+SUBSCRIPTION_ID = "bench-subscription"
+
+
+class ComboBench:
+    def __init__(self, connections: int):
+        EventTypes.CHAT_READ_EVENT.value.bind(SUBSCRIPTION_ID)
+        Credentials().emote_manager = StubEmoteManager("0")
+        Credentials().emote_manager.load()
+
+        self._manager = ComboManager()
+        self._sent: deque[float] = deque()
+        self._latencies: list[float] = []
+        self._processed = 0
+        self._error: Optional[Exception] = None
+
+        # Time every message from `handle` until the combo thread processed it
+        ingest = self._manager._ingest
+
+        def timed_ingest(*args: Any) -> None:
+            try:
+                ingest(*args)
+            except Exception as e:
+                self._error = e
+                raise
+            finally:
+                self._latencies.append(time.perf_counter() - self._sent.popleft())
+                self._processed += 1
+
+        self._manager._ingest = timed_ingest
+
+        self._combo_thread = Thread(
+            target=self._manager.combo_thread, name="ComboManager", daemon=True
+        )
+        self._combo_thread.start()
+        Thread(
+            target=ComboBroadcaster().flush_thread, name="ComboBroadcast", daemon=True
+        ).start()
+
+        Thread(target=CommServer.recv_thread, name="CommsServer", daemon=True).start()
+
+        for _ in range(connections):
+            self._connect_client()
+
+    def _connect_client(self) -> None:
+        """Connects a widget client to the comms server"""
+
+        while True:
+            try:
+                client = socket.create_connection(
+                    ("127.0.0.1", constants.HTTP_PORT + 1)
+                )
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)  # Server not listening yet
+
+        handshake = WSConnection(ConnectionType.CLIENT)
+        request = Request(host="localhost", target="/?topics=combo")
+        client.sendall(handshake.send(request))
+        # Wait for the handshake to finish before broadcasting to the client
+        client.recv(65536)
+        Thread(target=self._drain, args=(client,), daemon=True).start()
+
+    def _drain(self, sock: socket.socket) -> None:
+        """Reads and discards everything sent to a client
+
+        Args:
+            sock (socket.socket): The client socket
+        """
+
+        while sock.recv(65536):
+            pass
+
+    def run(self, messages: list[dict[str, Any]], rate: int) -> dict[str, float]:
+        """Feeds messages through the notification handler
+
+        Args:
+            messages (list[dict[str, Any]]): The notifications to handle
+            rate (int): Messages per second, 0 to send as fast as possible
+
+        Raises:
+            RuntimeError: When the combo thread failed handling a message
+
+        Returns:
+            dict[str, float]: The measured results
+        """
+
+        self._latencies.clear()
+        self._processed = 0
+
+        start = time.perf_counter()
+        for i, msg in enumerate(messages):
+            if rate > 0:
+                delay = start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self._sent.append(time.perf_counter())
+            TwitchMessageNotification(msg).handle()
+
+        while self._processed < len(messages) and self._combo_thread.is_alive():
+            time.sleep(0.001)
+
+        if self._error is not None:
+            raise RuntimeError("The combo thread failed handling a message") from (
+                self._error
+            )
+
+        elapsed = time.perf_counter() - start
+        latencies = sorted(self._latencies)
+
+        return {
+            "throughput": len(messages) / elapsed,
+            "p50": latencies[len(latencies) // 2] * 1e6,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1e6,
+        }
+
+    def peak_memory(self, messages: list[dict[str, Any]]) -> float:
+        """Measures the peak memory allocated while handling messages
+
+        Args:
+            messages (list[dict[str, Any]]): The notifications to handle
+
+        Returns:
+            float: The peak memory in KiB
+        """
+
+        tracemalloc.start()
+        self.run(messages, 0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return peak / 1024
+
+
+def per_call(func: Callable[[Any], Any], args: list[Any]) -> float:
+    """Measures the average time of a function call
+
+    Args:
+        func (Callable[[Any], Any]): The function to call
+        args (list[Any]): The arguments to call the function with, one call each
+
+    Returns:
+        float: The average time per call in microseconds
+    """
+
+    start = time.perf_counter()
+    for a in args:
+        func(a)
+
+    return (time.perf_counter() - start) / len(args) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="bench", description="Offline benchmark of the chat combo pipeline"
+    )
+    parser.add_argument(
+        "--rates",
+        default="10,100,1000,0",
+        help="Comma separated messages per second to test, 0 being unthrottled",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="Seconds to run each rate for"
+    )
+    parser.add_argument(
+        "--connections", type=int, default=3, help="Widget clients to broadcast to"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the chat load")
+    args = parser.parse_args()
+
+    gen = ChatLoadGenerator(SUBSCRIPTION_ID, seed=args.seed)
+    bench = ComboBench(args.connections)
+
+    # Plain text combos go through emote prefetching and creation as well
+    bench.run([gen.text_message("hello there")] * 5, 0)
+
+    print(
+        f"{'rate':>8} {'msgs':>7} {'msg/s':>10} "
+        f"{'p50 µs':>9} {'p99 µs':>9} {'peak KiB':>9}"
+    )
+
+    for rate in [int(r) for r in args.rates.split(",")]:
+        count = int(rate * args.duration) if rate > 0 else 10_000
+        messages = list(gen.stream(count))
+
+        result = bench.run(messages, rate)
+        peak = bench.peak_memory(messages)
+
+        print(
+            f"{rate or 'max':>8} {count:>7} {result['throughput']:>10.0f} "
+            f"{result['p50']:>9.1f} {result['p99']:>9.1f} {peak:>9.0f}"
+        )
+
+    fragments = [
+        m["payload"]["event"]["message"]["fragments"] for m in gen.stream(10_000)
+    ]
+    emote_time = per_call(Credentials().emote_manager.make_emote_string, fragments)
+    print(f"EmoteManager.make_emote_string: {emote_time:.1f} µs/call")
+
+    updates = [
+        {"event": "combo_update", "data": {"id": i, "combo": i}}
+        for i in range(10_000)
+    ]
+    # Update only batches are droppable, so slow clients are not evicted midway
+    broadcast_time = per_call(
+        lambda update: CommServer.broadcast(update, Topic.COMBO, droppable=True),
+        updates,
+    )
+    print(
+        f"CommServer.broadcast to {args.connections} clients: "
+        f"{broadcast_time:.1f} µs/call"
+    )
+
+
+main()
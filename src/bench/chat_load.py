@@ -0,0 +1,230 @@
+import itertools
+import random
+import time
+from typing import Any, Iterator
+
+from twitch.emotes.emotes import Emote, EmoteManager, EmotePlatform
+
+
+# Invisible characters 7TV appends to bypass Twitch's duplicate message check
+BYPASS_SUFFIXES = ["", "", "", " \U000e0000", "\u034f"]
+PUNCTUATION = ["", "", "", "!", "?", ".", "!!"]
+
+TWITCH_EMOTES = {
+    "Kappa": "25",
+    "LUL": "425618",
+    "PogChamp": "305954156",
+    "BibleThump": "86",
+    "Kreygasm": "41",
+}
+STUB_EMOTES = ["KEKW", "OMEGALUL", "Clap", "catJAM"] + [f"Stub{i}" for i in range(200)]
+WORDS = "what is this chat no way gg wp lets go true real based clip it did".split()
+
+
+class StubEmotePlatform(EmotePlatform):
+    def load_emotes(self):
+        """Creates a catalog of fake emotes without any network access
+
+        Returns:
+            dict[str, Emote]: The emotes created
+        """
+
+        return {
+            name: Emote(name, f"https://cdn.example.invalid/{name}", ["1x", "2x", "4x"])
+            for name in STUB_EMOTES
+        }
+
+
+class StubEmoteManager(EmoteManager):
+    CACHE = False
+
+    @staticmethod
+    def platforms():
+        """
+        Returns:
+            list[Type[EmotePlatform]]: The offline stub platform only
+        """
+
+        return [StubEmotePlatform]
+
+
+class ChatLoadGenerator:
+    def __init__(
+        self,
+        subscription_id: str,
+        vocabulary: int = 500,
+        zipf_s: float = 1.1,
+        seed: int = 0,
+    ):
+        self._subscription_id = subscription_id
+        self._rand = random.Random(seed)
+        self._messages = [self._make_message() for _ in range(vocabulary)]
+
+        # Zipf distributed popularity of the messages in the vocabulary
+        weights = [1 / (rank**zipf_s) for rank in range(1, vocabulary + 1)]
+        self._cum_weights = list(itertools.accumulate(weights))
+        self._counter = itertools.count()
+
+    def _make_message(self) -> list[tuple[str, str]]:
+        """Creates a random chat message
+
+        Returns:
+            list[tuple[str, str]]: The words of the message as (kind, text) pairs
+        """
+
+        parts = []
+        for _ in range(self._rand.randint(1, 8)):
+            kind = self._rand.choices(["text", "twitch", "stub"], [6, 1, 2])[0]
+
+            match kind:
+                case "text":
+                    parts.append(("text", self._rand.choice(WORDS)))
+                case "twitch":
+                    parts.append(("emote", self._rand.choice(list(TWITCH_EMOTES))))
+                case "stub":
+                    parts.append(("text", self._rand.choice(STUB_EMOTES)))
+
+        return parts
+
+    def _fragments(self, parts: list[tuple[str, str]]) -> list[dict[str, Any]]:
+        """Fragments a message the way Twitch does
+
+        Args:
+            parts (list[tuple[str, str]]): The words of the message
+
+        Returns:
+            list[dict[str, Any]]: The fragments of the message
+        """
+
+        fragments = []
+        text_buffer = []
+
+        for kind, word in parts:
+            if kind == "text":
+                text_buffer.append(word)
+                continue
+
+            if text_buffer:
+                fragments.append(self._text_fragment(" ".join(text_buffer) + " "))
+                text_buffer.clear()
+
+            fragments.append(
+                {
+                    "type": "emote",
+                    "text": word,
+                    "cheermote": None,
+                    "emote": {
+                        "id": TWITCH_EMOTES[word],
+                        "emote_set_id": "0",
+                        "owner_id": "0",
+                        "format": ["static"],
+                    },
+                    "mention": None,
+                }
+            )
+
+        if text_buffer:
+            fragments.append(self._text_fragment(" ".join(text_buffer)))
+
+        return fragments
+
+    def _text_fragment(self, text: str) -> dict[str, Any]:
+        """
+        Args:
+            text (str): The text of the fragment
+
+        Returns:
+            dict[str, Any]: A text fragment as sent by Twitch
+        """
+
+        return {
+            "type": "text",
+            "text": text,
+            "cheermote": None,
+            "emote": None,
+            "mention": None,
+        }
+
+    def message(self) -> dict[str, Any]:
+        """Creates the next `channel.chat.message` notification
+
+        Returns:
+            dict[str, Any]: The notification as sent through EventSub
+        """
+
+        parts = self._rand.choices(self._messages, cum_weights=self._cum_weights)[0]
+        fragments = self._fragments(parts)
+
+        # Vary the message like chat does when spamming
+        variant = self._rand.choice(PUNCTUATION) + self._rand.choice(BYPASS_SUFFIXES)
+        if fragments[-1]["type"] == "text":
+            fragments[-1] = fragments[-1] | {"text": fragments[-1]["text"] + variant}
+        elif variant:
+            fragments.append(self._text_fragment(" " + variant))
+
+        return self.notification(fragments)
+
+    def text_message(self, text: str) -> dict[str, Any]:
+        """Creates a `channel.chat.message` notification without any emotes
+
+        Args:
+            text (str): The text of the message
+
+        Returns:
+            dict[str, Any]: The notification as sent through EventSub
+        """
+
+        return self.notification([self._text_fragment(text)])
+
+    def notification(self, fragments: list[dict[str, Any]]) -> dict[str, Any]:
+        """Wraps message fragments into a `channel.chat.message` notification
+
+        Args:
+            fragments (list[dict[str, Any]]): The fragments of the message
+
+        Returns:
+            dict[str, Any]: The notification as sent through EventSub
+        """
+
+        text = "".join(f["text"] for f in fragments)
+
+        num = next(self._counter)
+        return {
+            "metadata": {
+                "message_id": f"bench-{num}",
+                "message_type": "notification",
+                "message_timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "subscription_type": "channel.chat.message",
+                "subscription_version": "1",
+            },
+            "payload": {
+                "subscription": {
+                    "id": self._subscription_id,
+                    "type": "channel.chat.message",
+                    "version": "1",
+                },
+                "event": {
+                    "broadcaster_user_id": "1",
+                    "broadcaster_user_login": "bench",
+                    "broadcaster_user_name": "bench",
+                    "chatter_user_id": str(num % 5000),
+                    "chatter_user_login": f"chatter{num % 5000}",
+                    "chatter_user_name": f"chatter{num % 5000}",
+                    "message_id": f"bench-msg-{num}",
+                    "message": {"text": text, "fragments": fragments},
+                    "message_type": "text",
+                },
+            },
+        }
+
+    def stream(self, count: int) -> Iterator[dict[str, Any]]:
+        """
+        Args:
+            count (int): Amount of notifications to create
+
+        Yields:
+            Iterator[dict[str, Any]]: The created notifications
+        """
+
+        for _ in range(count):
+            yield self.message()
@@ -0,0 +1,131 @@
+import argparse
+import json
+import statistics
+from threading import Thread
+import time
+
+import websocket
+
+import constants
+from mock.twitch_mock import MockTwitch
+from twitch.credentials import Credentials
+from twitch.twitch import TwitchConn
+from widget.broadcast import ComboBroadcaster
+from widget.combo import ComboManager
+from widget.config import Config
+from widget.widget_comm import CommServer
+
+
+PROBE = "latency probe"
+
+
+def wait_for(predicate, timeout: float) -> None:
+    """Waits until the predicate is true
+
+    Args:
+        predicate (Callable[[], bool]): The condition to wait for
+        timeout (float): Seconds after which to give up
+
+    Raises:
+        TimeoutError: When the condition did not become true in time
+    """
+
+    end = time.time() + timeout
+    while not predicate():
+        if time.time() > end:
+            raise TimeoutError("Timed out waiting for the widget pipeline")
+        time.sleep(0.01)
+
+
+def probe_counts(frame: str, probe_ids: set[int]) -> list[int]:
+    """Extracts the combo counts of the probe message from a widget frame
+
+    Args:
+        frame (str): The frame received by the widget
+        probe_ids (set[int]): The combo ids of the probe, extended by new ones
+
+    Returns:
+        list[int]: The counts of the probe in the frame
+    """
+
+    msg = json.loads(frame)
+    events = msg["data"] if msg["event"] == "batch" else [msg]
+
+    for e in events:
+        if e["event"] == "combo_create" and e["data"]["text"] == PROBE:
+            probe_ids.add(e["data"]["id"])
+
+    return [
+        e["data"]["combo"]
+        for e in events
+        if e["event"] in ("combo_create", "combo_update")
+        and e["data"]["id"] in probe_ids
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="bench.latency",
+        description="Chat-in to widget-frame-out latency against the Twitch mock",
+    )
+    parser.add_argument("--port", type=int, default=4160, help="Port of the mock")
+    parser.add_argument("--probes", type=int, default=200, help="Messages to time")
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="Background chat messages per second"
+    )
+    args = parser.parse_args()
+
+    mock = MockTwitch("127.0.0.1", args.port)
+    mock.start()
+    constants.use_twitch_mock(f"127.0.0.1:{args.port}")
+
+    Thread(target=ComboManager().combo_thread, name="ComboManager", daemon=True).start()
+    Thread(
+        target=ComboBroadcaster().flush_thread, name="ComboBroadcast", daemon=True
+    ).start()
+    Thread(target=CommServer.recv_thread, name="CommsServer", daemon=True).start()
+    Thread(
+        target=TwitchConn().ingest_thread, name="TwitchIngest", daemon=True
+    ).start()
+
+    Credentials().access_token = "mock"
+    TwitchConn().run()
+    wait_for(lambda: len(mock._chat_subscriptions()) > 0, 10)
+
+    widget = websocket.create_connection(
+        f"ws://localhost:{constants.HTTP_PORT + 1}/?topics=combo"
+    )
+
+    if args.rate > 0:
+        Thread(target=mock.chat_loop, args=(args.rate,), daemon=True).start()
+
+    # Bring the probe up to a visible combo before timing single messages
+    for _ in range(Config()["combo_threshold"]):
+        mock.send_chat(PROBE)
+
+    latencies = []
+    probe_ids: set[int] = set()
+    expected = Config()["combo_threshold"]
+    while not any(c >= expected for c in probe_counts(widget.recv(), probe_ids)):
+        pass
+
+    for _ in range(args.probes):
+        expected += 1
+        sent = mock.send_chat(PROBE)
+
+        while not any(c >= expected for c in probe_counts(widget.recv(), probe_ids)):
+            pass
+
+        latencies.append(time.perf_counter() - sent)
+
+        # Let the broadcast tick pass so every probe is timed on its own
+        time.sleep(1 / Config()["broadcast_rate"])
+
+    latencies.sort()
+    print(f"Chat-in to widget-frame-out latency over {args.probes} messages:")
+    print(f"  p50  {statistics.median(latencies) * 1000:8.2f} ms")
+    print(f"  p99  {latencies[int(len(latencies) * 0.99)] * 1000:8.2f} ms")
+    print(f"  max  {latencies[-1] * 1000:8.2f} ms")
+
+
+main()
@@ -5,9 +5,21 @@ import sys
 # HTTP server
 HTTP_PORT = 4150
 FALLBACK_MIME = "application/octet-stream"
+# Threads handling HTTP requests, and requests waiting for one of them. Idle
+# keep-alive connections do not hold a worker, so workers only need to cover
+# requests in flight, including emote images fetched on a cache miss
+HTTP_WORKERS = 16
+HTTP_QUEUE = 64
+# Seconds an idle keep-alive connection is kept open
+HTTP_KEEPALIVE = 5.0
 
 CONFIG_NAME = "config.json"
 
+# Frames queued per widget connection before dropping updates or disconnecting
+COMMS_SEND_QUEUE = 256
+# Smallest message in bytes worth compressing for clients supporting it
+COMMS_DEFLATE_THRESHOLD = 256
+
 # Folders
 if getattr(sys, "frozen", False):
     ROOT_DIR = sys._MEIPASS
@@ -22,6 +34,9 @@ if os.name == "nt":
 else:
     CONFIG_DIR = os.path.join(os.getenv("HOME"), ".config", "ChatWidget")
 
+EMOTE_CACHE_DIR = os.path.join(CONFIG_DIR, "emotes")
+EMOTE_IMAGE_DIR = os.path.join(CONFIG_DIR, "emote_images")
+
 os.makedirs(CONFIG_DIR, exist_ok=True)
 if not os.path.exists(os.path.join(CONFIG_DIR, CONFIG_NAME)):
     with open(os.path.join(ROOT_DIR, CONFIG_NAME), "r") as rf:
@@ -96,3 +111,44 @@ BETTERTTV_CDN = "https://cdn.betterttv.net/emote"
 # FFZ user endpoint
 FRANKERFACEZ_ROOM = "https://api.frankerfacez.com/v1/room/id"
 FRANKERFACEZ_GLOBAL = "https://api.frankerfacez.com/v1/set/global"
+
+# Seconds to wait for an emote provider before going on without its emotes
+EMOTE_TIMEOUT = 10.0
+# Seconds after which cached emotes get revalidated with their provider
+EMOTE_CACHE_TTL = 6 * 60 * 60
+
+# Hosts emote images are proxied from, and bytes of images kept on disk
+EMOTE_HOSTS = (
+    "static-cdn.jtvnw.net",
+    "cdn.7tv.app",
+    "cdn.betterttv.net",
+    "cdn.frankerfacez.com",
+)
+EMOTE_IMAGE_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def use_twitch_mock(address: str) -> None:
+    """Points all Twitch and emote provider endpoints at a local mock server
+
+    Args:
+        address (str): The `host:port` of the mock's REST endpoints, its
+            EventSub WebSocket being on the next port
+    """
+
+    global TWITCH_ENDPOINT, TWITCH_EVENTSUB, TWTICH_EMOTES, TWITCH_USERS
+    global SEVENTV_GQL, BETTERTTV_EMOTES, BETTERTTV_USER
+    global FRANKERFACEZ_ROOM, FRANKERFACEZ_GLOBAL
+
+    host, port = address.rsplit(":", 1)
+    base = f"http://{host}:{port}"
+
+    TWITCH_ENDPOINT = f"ws://{host}:{int(port) + 1}/ws"
+    TWITCH_EVENTSUB = f"{base}/helix/eventsub/subscriptions"
+    TWTICH_EMOTES = f"{base}/helix/chat/emotes"
+    TWITCH_USERS = f"{base}/helix/users"
+
+    SEVENTV_GQL = f"{base}/7tv/gql"
+    BETTERTTV_EMOTES = f"{base}/bttv/global"
+    BETTERTTV_USER = f"{base}/bttv/user"
+    FRANKERFACEZ_ROOM = f"{base}/ffz/room"
+    FRANKERFACEZ_GLOBAL = f"{base}/ffz/global"
@@ -1,12 +1,17 @@
+import argparse
 import os
 import sys
 from threading import Thread
 import time
+import constants
 from log import LOG
+from twitch.capture import FrameReplayer
 from twitch.credentials import Credentials
 from twitch.events import EventTypes
 from twitch.twitch import TwitchConn
+from web.assets import AssetCache
 from web.webserver import HTTPHandler
+from widget.broadcast import ComboBroadcaster
 from widget.combo import ComboManager
 from widget.widget_comm import CommServer
 
@@ -15,6 +20,39 @@ if __name__ != "__main__":
     print("Try executing this file directly!")
     exit(-1)
 
+parser = argparse.ArgumentParser(description="Twitch chat combo widget for OBS")
+parser.add_argument("--verbose", action="store_true", help="Log debug messages")
+parser.add_argument(
+    "--capture", metavar="FILE", help="Append all frames received from Twitch to FILE"
+)
+parser.add_argument(
+    "--replay",
+    metavar="FILE",
+    help="Replay frames captured to FILE instead of connecting to Twitch",
+)
+parser.add_argument(
+    "--speed",
+    type=float,
+    default=1.0,
+    help="Playback speed factor for --replay, 0 to replay as fast as possible",
+)
+parser.add_argument(
+    "--mock-twitch",
+    metavar="HOST:PORT",
+    help="Use the local Twitch mock server (python -m mock) instead of Twitch",
+)
+parser.add_argument(
+    "--dev",
+    action="store_true",
+    help="Serve changes to the web folder without restarting",
+)
+args = parser.parse_args()
+
+if args.mock_twitch:
+    constants.use_twitch_mock(args.mock_twitch)
+
+AssetCache().dev = args.dev
+
 # Set console title
 if os.name == "nt":
     import ctypes
@@ -26,7 +64,25 @@ else:
 # Start services in background threads
 Thread(target=HTTPHandler.start_server, name="WebServer", daemon=True).start()
 Thread(target=ComboManager().combo_thread, name="ComboManager", daemon=True).start()
+Thread(
+    target=ComboBroadcaster().flush_thread, name="ComboBroadcast", daemon=True
+).start()
 Thread(target=CommServer.recv_thread, name="CommsServer", daemon=True).start()
+Thread(target=TwitchConn().ingest_thread, name="TwitchIngest", daemon=True).start()
+
+if args.capture:
+    TwitchConn().capture(args.capture)
+
+if args.mock_twitch:
+    Credentials().access_token = "mock"
+    TwitchConn().run()
+
+if args.replay:
+    Thread(
+        target=FrameReplayer(args.replay, args.speed).replay,
+        name="Replay",
+        daemon=True,
+    ).start()
 
 
 # Wait until the user presses ^C or a shutdown occurs
@@ -40,7 +96,8 @@ except KeyboardInterrupt:
 LOG.info("Shutting down...")
 
 # Shut down all services
-EventTypes.delete_all()
+if not args.replay:
+    EventTypes.delete_all()
 TwitchConn().stop()
 CommServer.close_all()
 
@@ -0,0 +1,38 @@
+import argparse
+from threading import Thread
+import time
+
+from mock.twitch_mock import MockTwitch
+
+
+parser = argparse.ArgumentParser(
+    prog="mock", description="Local stand-in for the Twitch EventSub and Helix APIs"
+)
+parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+parser.add_argument(
+    "--port",
+    type=int,
+    default=4160,
+    help="Port of the REST endpoints, the EventSub WebSocket uses the next one",
+)
+parser.add_argument(
+    "--keepalive", type=float, default=10.0, help="Keepalive timeout in seconds"
+)
+parser.add_argument(
+    "--rate", type=float, default=0.0, help="Generated chat messages per second"
+)
+args = parser.parse_args()
+
+mock = MockTwitch(args.host, args.port, args.keepalive)
+mock.start()
+
+if args.rate > 0:
+    Thread(
+        target=mock.chat_loop, args=(args.rate,), name="MockChat", daemon=True
+    ).start()
+
+try:
+    while True:
+        time.sleep(0.5)
+except KeyboardInterrupt:
+    pass
@@ -0,0 +1,518 @@
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+from threading import Lock, Thread
+import time
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlsplit
+import uuid
+import zlib
+
+from wsproto import WSConnection
+from wsproto.connection import ConnectionType
+from wsproto.events import (
+    AcceptConnection,
+    CloseConnection,
+    Event,
+    Ping,
+    Request,
+    TextMessage,
+)
+
+from bench.chat_load import ChatLoadGenerator
+from log import LOG
+
+
+def _timestamp() -> str:
+    """
+    Returns:
+        str: The current time formatted like Twitch does
+    """
+
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class MockSession:
+    def __init__(self, server: "MockTwitch", sock: socket.socket):
+        self._server = server
+        self._sock = sock
+        self._conn = WSConnection(ConnectionType.SERVER)
+        self._lock = Lock()
+        self._last_sent = time.time()
+        self.id: Optional[str] = None
+
+    def send(
+        self, message_type: str, payload: dict[str, Any], **metadata: str
+    ) -> None:
+        """Sends an EventSub message to the client
+
+        Args:
+            message_type (str): The `metadata.message_type` of the message
+            payload (dict[str, Any]): The payload of the message
+            **metadata (str): Additional metadata fields of the message
+        """
+
+        message = {
+            "metadata": {
+                "message_id": str(uuid.uuid4()),
+                "message_type": message_type,
+                "message_timestamp": _timestamp(),
+            }
+            | metadata,
+            "payload": payload,
+        }
+
+        self._send_event(TextMessage(json.dumps(message)))
+
+    def send_keepalive(self) -> None:
+        """Sends a keepalive message if nothing was sent for the keepalive timeout"""
+
+        if time.time() - self._last_sent >= self._server.keepalive:
+            self.send("session_keepalive", {})
+
+    def close(self) -> None:
+        """Closes the connection"""
+
+        try:
+            self._send_event(CloseConnection(1000, "Closing connection."))
+        except Exception:
+            pass
+
+        self._sock.close()
+
+    def handle(self) -> None:
+        """Handles the WebSocket connection until it closes"""
+
+        try:
+            self._read()
+        except OSError:
+            pass
+        finally:
+            self._server.disconnected(self)
+            self._sock.close()
+
+    def _read(self) -> None:
+        """Reads data from the WebSocket and handles it"""
+
+        while True:
+            data = self._sock.recv(4096)
+            if not data:
+                return
+
+            self._conn.receive_data(data)
+
+            for event in self._conn.events():
+                if isinstance(event, CloseConnection):
+                    self._send_event(event.response())
+                    return
+
+                elif isinstance(event, Ping):
+                    self._send_event(event.response())
+
+                elif isinstance(event, Request):
+                    self._send_event(AcceptConnection())
+                    query = parse_qs(urlsplit(event.target).query)
+                    self._server.connected(self, query.get("session", [None])[0])
+
+    def _send_event(self, event: Event) -> None:
+        """Sends a wsproto event to the client
+
+        Args:
+            event (Event): The event to send
+        """
+
+        with self._lock:
+            self._sock.sendall(self._conn.send(event))
+            self._last_sent = time.time()
+
+
+class MockHTTPHandler(BaseHTTPRequestHandler):
+    server: "MockHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        LOG.debug(f"Mock HTTP: {format % args}")
+
+    def _send_json(self, status: int, data: Any) -> None:
+        """Sends a JSON response
+
+        Args:
+            status (int): The HTTP status code
+            data (Any): The data to encode as JSON
+        """
+
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Any:
+        """
+        Returns:
+            Any: The JSON body of the request
+        """
+
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return {}
+
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        """Callback for GET requests"""
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        match url.path:
+            case "/helix/users":
+                login = query.get("login", [""])[0]
+                user_id = str(zlib.crc32(login.encode()))
+                self._send_json(200, {"data": [{"id": user_id, "login": login}]})
+
+            case "/bttv/global":
+                self._send_json(200, [])
+
+            case "/ffz/global":
+                self._send_json(200, {"sets": {}})
+
+            case path if path.startswith("/bttv/user/"):
+                self._send_json(200, {"sharedEmotes": [], "channelEmotes": []})
+
+            case path if path.startswith("/ffz/room/"):
+                self._send_json(200, {"sets": {}})
+
+            case _:
+                self._send_json(404, {"error": "Not Found"})
+
+    def do_POST(self):
+        """Callback for POST requests"""
+
+        mock = self.server.mock
+        body = self._read_json()
+
+        match urlsplit(self.path).path:
+            case "/helix/eventsub/subscriptions":
+                self._send_json(202, {"data": [mock.subscribe(body)]})
+
+            case "/7tv/gql":
+                if "emoteSet" in body.get("query", ""):
+                    self._send_json(200, {"data": {"emoteSet": {"emotes": []}}})
+                else:
+                    data = {"userByConnection": {"emote_sets": []}}
+                    self._send_json(200, {"data": data})
+
+            case "/mock/chat":
+                sent = mock.send_chat(body["text"], body.get("fragments", None))
+                self._send_json(200, {"sent": sent})
+
+            case "/mock/reconnect":
+                mock.reconnect()
+                self._send_json(200, {})
+
+            case "/mock/revoke":
+                mock.revoke()
+                self._send_json(200, {})
+
+            case _:
+                self._send_json(404, {"error": "Not Found"})
+
+    def do_DELETE(self):
+        """Callback for DELETE requests"""
+
+        url = urlsplit(self.path)
+        if url.path != "/helix/eventsub/subscriptions":
+            self._send_json(404, {"error": "Not Found"})
+            return
+
+        self.server.mock.unsubscribe(parse_qs(url.query).get("id", [""])[0])
+
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    mock: "MockTwitch"
+
+
+class MockTwitch:
+    """Local stand-in for the EventSub WebSocket and the used REST endpoints
+
+    Serves the REST endpoints on `port` and the EventSub WebSocket on
+    `port + 1`.
+    """
+
+    def __init__(self, host: str, port: int, keepalive: float = 10.0):
+        self._host = host
+        self._port = port
+        self.keepalive = keepalive
+
+        self._lock = Lock()
+        self._sessions: dict[str, MockSession] = {}
+        self._subscriptions: dict[str, dict[str, Any]] = {}
+        self._chat = ChatLoadGenerator("")
+
+    def start(self) -> None:
+        """Starts all mock servers in background threads"""
+
+        httpd = MockHTTPServer((self._host, self._port), MockHTTPHandler)
+        httpd.mock = self
+        Thread(target=httpd.serve_forever, name="MockHTTP", daemon=True).start()
+
+        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind((self._host, self._port + 1))
+        srv.listen(socket.SOMAXCONN)
+        Thread(
+            target=self._accept, args=(srv,), name="MockEventSub", daemon=True
+        ).start()
+        Thread(target=self._keepalive, name="MockKeepAlive", daemon=True).start()
+
+        LOG.info(f"Mock Twitch running on {self._host}:{self._port}")
+
+    def _accept(self, srv: socket.socket) -> None:
+        """Accepts EventSub WebSocket connections
+
+        Args:
+            srv (socket.socket): The listening socket
+        """
+
+        while True:
+            sock, _ = srv.accept()
+            session = MockSession(self, sock)
+            Thread(target=session.handle, name="MockSession", daemon=True).start()
+
+    def _keepalive(self) -> None:
+        """Sends keepalive messages to idle sessions"""
+
+        while True:
+            time.sleep(min(1.0, self.keepalive))
+
+            for session in self._session_list():
+                try:
+                    session.send_keepalive()
+                except OSError:
+                    pass
+
+    def _session_list(self) -> list[MockSession]:
+        """
+        Returns:
+            list[MockSession]: All currently connected sessions
+        """
+
+        with self._lock:
+            return list(self._sessions.values())
+
+    def connected(self, session: MockSession, reconnect_id: Optional[str]) -> None:
+        """Welcomes a newly connected session
+
+        Args:
+            session (MockSession): The session that connected
+            reconnect_id (Optional[str]): The ID of the session being reconnected
+        """
+
+        with self._lock:
+            old = self._sessions.pop(reconnect_id, None) if reconnect_id else None
+            session.id = reconnect_id if old is not None else str(uuid.uuid4())
+            self._sessions[session.id] = session
+
+        session.send(
+            "session_welcome",
+            {
+                "session": {
+                    "id": session.id,
+                    "status": "connected",
+                    "connected_at": _timestamp(),
+                    "keepalive_timeout_seconds": int(self.keepalive),
+                    "reconnect_url": None,
+                }
+            },
+        )
+
+        # Twitch closes the old connection once the new one is welcomed
+        if old is not None:
+            old.close()
+
+    def disconnected(self, session: MockSession) -> None:
+        """Forgets a session and its subscriptions when it disconnects
+
+        Args:
+            session (MockSession): The session that disconnected
+        """
+
+        with self._lock:
+            if self._sessions.get(session.id, None) is not session:
+                return
+
+            del self._sessions[session.id]
+            self._subscriptions = {
+                k: v
+                for k, v in self._subscriptions.items()
+                if v["transport"]["session_id"] != session.id
+            }
+
+    def subscribe(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Creates an EventSub subscription
+
+        Args:
+            body (dict[str, Any]): The subscription request
+
+        Returns:
+            dict[str, Any]: The created subscription
+        """
+
+        sub = {
+            "id": str(uuid.uuid4()),
+            "status": "enabled",
+            "type": body["type"],
+            "version": body["version"],
+            "condition": body["condition"],
+            "transport": body["transport"],
+            "created_at": _timestamp(),
+            "cost": 0,
+        }
+
+        with self._lock:
+            self._subscriptions[sub["id"]] = sub
+
+        return sub
+
+    def unsubscribe(self, id: str) -> None:
+        """Deletes an EventSub subscription
+
+        Args:
+            id (str): The ID of the subscription
+        """
+
+        with self._lock:
+            self._subscriptions.pop(id, None)
+
+    def _chat_subscriptions(self) -> list[tuple[MockSession, dict[str, Any]]]:
+        """
+        Returns:
+            list[tuple[MockSession, dict[str, Any]]]: All chat subscriptions with their session
+        """
+
+        with self._lock:
+            return [
+                (self._sessions[sub["transport"]["session_id"]], sub)
+                for sub in self._subscriptions.values()
+                if sub["type"] == "channel.chat.message"
+                and sub["transport"]["session_id"] in self._sessions
+            ]
+
+    def send_chat(
+        self,
+        text: Optional[str] = None,
+        fragments: Optional[list[dict[str, Any]]] = None,
+    ) -> float:
+        """Sends a chat message notification to all chat subscriptions
+
+        Args:
+            text (Optional[str], optional): The message text. Defaults to a generated message.
+            fragments (Optional[list[dict[str, Any]]], optional): The message fragments. Defaults to one text fragment.
+
+        Returns:
+            float: The `time.perf_counter()` at which the notification was sent
+        """
+
+        event = self._chat.message()["payload"]["event"]
+
+        if text is not None:
+            if fragments is None:
+                fragments = [
+                    {
+                        "type": "text",
+                        "text": text,
+                        "cheermote": None,
+                        "emote": None,
+                        "mention": None,
+                    }
+                ]
+
+            event["message"] = {"text": text, "fragments": fragments}
+
+        sent = time.perf_counter()
+        for session, sub in self._chat_subscriptions():
+            self._notify(session, sub, event)
+
+        return sent
+
+    def _notify(
+        self, session: MockSession, sub: dict[str, Any], event: dict[str, Any]
+    ) -> None:
+        """Sends a notification for a subscription
+
+        Args:
+            session (MockSession): The session the subscription belongs to
+            sub (dict[str, Any]): The subscription
+            event (dict[str, Any]): The event data of the notification
+        """
+
+        payload = {"subscription": sub, "event": event}
+        session.send(
+            "notification",
+            payload,
+            subscription_type=sub["type"],
+            subscription_version=sub["version"],
+        )
+
+    def chat_loop(self, rate: float) -> None:
+        """Sends generated chat messages at a fixed rate
+
+        Args:
+            rate (float): The messages per second to send
+        """
+
+        start = time.perf_counter()
+        count = 0
+
+        while True:
+            delay = start + count / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            self.send_chat()
+            count += 1
+
+    def reconnect(self) -> None:
+        """Asks all sessions to reconnect like Twitch does before maintenance"""
+
+        for session in self._session_list():
+            url = f"ws://{self._host}:{self._port + 1}/?session={session.id}"
+            session.send(
+                "session_reconnect",
+                {
+                    "session": {
+                        "id": session.id,
+                        "status": "reconnecting",
+                        "keepalive_timeout_seconds": None,
+                        "reconnect_url": url,
+                        "connected_at": _timestamp(),
+                    }
+                },
+            )
+
+    def revoke(self) -> None:
+        """Revokes all subscriptions like Twitch does when the user revokes access"""
+
+        with self._lock:
+            subs = list(self._subscriptions.values())
+            self._subscriptions.clear()
+
+        for sub in subs:
+            session = self._sessions.get(sub["transport"]["session_id"], None)
+            if session is None:
+                continue
+
+            revoked = sub | {"status": "authorization_revoked"}
+            session.send(
+                "revocation",
+                {"subscription": revoked},
+                subscription_type=sub["type"],
+                subscription_version=sub["version"],
+            )
@@ -0,0 +1,57 @@
+from threading import Lock
+from typing import Callable
+
+from singleton import singleton
+
+
+@singleton
+class Stats:
+    def __init__(self):
+        self._values: dict[str, int] = {}
+        self._gauges: dict[str, Callable[[], int]] = {}
+        self._lock = Lock()
+
+    def incr(self, key: str, amount: int = 1) -> None:
+        """Increments a counter
+
+        Args:
+            key (str): The name of the counter
+            amount (int, optional): The amount to add. Defaults to 1.
+        """
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def add_gauge(self, key: str, gauge: Callable[[], int]) -> None:
+        """Adds a gauge which gets read whenever the values are dumped
+
+        Args:
+            key (str): The name of the gauge
+            gauge (Callable[[], int]): Returns the current value of the gauge
+        """
+
+        self._gauges[key] = gauge
+
+    def set_max(self, key: str, value: int) -> None:
+        """Raises a high-water mark to the value if it is higher
+
+        Args:
+            key (str): The name of the high-water mark
+            value (int): The value to compare to
+        """
+
+        with self._lock:
+            if value > self._values.get(key, 0):
+                self._values[key] = value
+
+    def dump(self) -> dict[str, int]:
+        """Dumps all current values
+
+        Returns:
+            dict[str, int]: The values by name
+        """
+
+        with self._lock:
+            values = dict(self._values)
+
+        return values | {k: gauge() for k, gauge in self._gauges.items()}
@@ -0,0 +1,117 @@
+import gzip
+import json
+from threading import Lock
+import time
+from typing import Any, Iterator
+
+from log import LOG
+
+
+class FrameRecorder:
+    # Seconds between flushing the compressed stream to disk
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = Lock()
+        self._last_flush = time.time()
+
+    def write(self, frame: str) -> None:
+        """Appends a raw frame with its receive time to the capture
+
+        Args:
+            frame (str): The frame as received from Twitch
+        """
+
+        cur_time = time.time()
+        line = json.dumps({"t": cur_time, "frame": frame})
+
+        with self._lock:
+            self._file.write(line + "\n")
+
+            if cur_time - self._last_flush > self.FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = cur_time
+
+    def close(self) -> None:
+        """Flushes and closes the capture file"""
+
+        with self._lock:
+            self._file.close()
+
+        LOG.info(f"Saved capture to {self._path}")
+
+
+class FrameReplayer:
+    # Message types which would talk to Twitch when handled
+    SKIPPED = {"session_welcome", "session_reconnect", "revocation"}
+
+    def __init__(self, path: str, speed: float):
+        """
+        Args:
+            path (str): The capture file to replay
+            speed (float): Playback speed factor, 0 to replay as fast as possible
+        """
+
+        self._path = path
+        self._speed = speed
+
+    def _entries(self) -> Iterator[dict[str, Any]]:
+        """Reads the captured frames with their receive times
+
+        Captures of a process killed before closing its recorder end without
+        a gzip end marker and possibly in the middle of a line, everything
+        flushed up to there is still read.
+
+        Yields:
+            Iterator[dict[str, Any]]: The entries in the order they were captured
+        """
+
+        with gzip.open(self._path, "rt", encoding="utf-8") as rf:
+            try:
+                for line in rf:
+                    if not line.endswith("\n"):
+                        break  # Cut off while being written
+
+                    yield json.loads(line)
+            except EOFError:
+                LOG.warning(f"Capture {self._path} was not closed properly")
+
+    def replay(self) -> None:
+        """Feeds all captured frames through the Twitch message handler"""
+
+        from twitch.events import EventTypes
+        from twitch.twitch import TwitchConn
+
+        conn = TwitchConn()
+        start = time.time()
+        first = None
+        count = 0
+
+        speed = f"{self._speed}x" if self._speed > 0 else "max"
+        LOG.info(f"Replaying {self._path} at {speed} speed")
+
+        for entry in self._entries():
+            frame = json.loads(entry["frame"])
+
+            metadata = frame.get("metadata", {})
+            if metadata.get("message_type") in self.SKIPPED:
+                continue
+
+            subscription = frame.get("payload", {}).get("subscription", None)
+            if subscription is not None:
+                EventTypes.bind(subscription["type"], subscription["id"])
+
+            if first is None:
+                first = entry["t"]
+
+            if self._speed > 0:
+                delay = start + (entry["t"] - first) / self._speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            conn._on_message(None, entry["frame"])
+            count += 1
+
+        LOG.info(f"Replayed {count} frames in {time.time() - start:.2f}s")
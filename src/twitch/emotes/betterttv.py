@@ -1,5 +1,4 @@
 from typing import Any
-import requests
 import constants
 from log import LOG
 from twitch.emotes.emotes import Emote, EmotePlatform
@@ -7,7 +6,7 @@ from twitch.emotes.emotes import Emote, EmotePlatform
 
 class BetterTTVChannel(EmotePlatform):
     def load_emotes(self):
-        resp = requests.get(f"{constants.BETTERTTV_USER}/{self._channel_id}")
+        resp = self._request("GET", f"{constants.BETTERTTV_USER}/{self._channel_id}")
 
         if not resp.ok:
             LOG.info(f"BetterTTV user by ID {self._channel_id} not found.")
@@ -38,7 +37,7 @@ class BetterTTVGlobal(BetterTTVChannel):
             dict[str, Emote]: The emotes that were loaded
         """
 
-        resp = requests.get(constants.BETTERTTV_EMOTES)
+        resp = self._request("GET", constants.BETTERTTV_EMOTES)
         resp.raise_for_status()
 
         return self._load_set(resp.json())
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+from typing import Any
+
+import constants
+from log import LOG
+from twitch.emotes.emotes import Emote
+
+
+class CachedCatalog:
+    def __init__(
+        self, emotes: dict[str, Emote], fetched: float, validators: dict[str, str]
+    ):
+        self.emotes = emotes
+        self.fetched = fetched
+        self.validators = validators
+
+    @property
+    def stale(self) -> bool:
+        """
+        Returns:
+            bool: Whether the catalog is old enough to be revalidated
+        """
+
+        return time.time() - self.fetched > constants.EMOTE_CACHE_TTL
+
+
+class EmoteCache:
+    """Catalogs of all emote platforms of one channel, stored in one file
+
+    Emotes are stored as `name: [cdn, files]` pairs to keep the file small.
+    """
+
+    def __init__(self, channel_id: str):
+        self._path = os.path.join(
+            constants.EMOTE_CACHE_DIR, f"{os.path.basename(channel_id)}.json"
+        )
+
+    def read(self) -> dict[str, CachedCatalog]:
+        """Reads all cached catalogs
+
+        Returns:
+            dict[str, CachedCatalog]: The catalogs by platform name, empty if not cached
+        """
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as rf:
+                data = json.load(rf)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            LOG.warning(f"Ignoring broken emote cache {self._path}: {e}")
+            return {}
+
+        return {
+            platform: CachedCatalog(
+                {n: Emote(n, cdn, files) for n, (cdn, files) in c["emotes"].items()},
+                c["fetched"],
+                c["validators"],
+            )
+            for platform, c in data.items()
+        }
+
+    def write(self, catalogs: dict[str, CachedCatalog]) -> None:
+        """Replaces the cached catalogs
+
+        Args:
+            catalogs (dict[str, CachedCatalog]): The catalogs by platform name
+        """
+
+        data: dict[str, Any] = {
+            platform: {
+                "fetched": c.fetched,
+                "validators": c.validators,
+                "emotes": {n: [e.cdn, e.files] for n, e in c.emotes.items()},
+            }
+            for platform, c in catalogs.items()
+        }
+
+        os.makedirs(constants.EMOTE_CACHE_DIR, exist_ok=True)
+        # Unique, as loads of the same channel may overlap
+        tmp = f"{self._path}.{id(data)}.tmp"
+
+        try:
+            with open(tmp, "w", encoding="utf-8") as wf:
+                json.dump(data, wf, separators=(",", ":"))
+            os.replace(tmp, self._path)
+        except OSError as e:
+            LOG.warning(f"Could not write emote cache {self._path}: {e}")
@@ -1,7 +1,15 @@
 import abc
-from typing import Any, Type
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from threading import Lock
+import time
+from types import MappingProxyType
+from typing import Any, Mapping, Optional, Type
+from urllib.parse import quote
+
+import requests
 
 import constants
+from log import LOG
 
 
 class Emote:
@@ -61,7 +69,14 @@ class Emote:
         return f"{self.cdn}/{f}"
 
 
+class NotModified(Exception):
+    """Raised when a platform's emotes did not change since they were cached"""
+
+
 class EmoteManager(abc.ABC):
+    # Whether emotes are cached on disk between runs
+    CACHE = True
+
     @staticmethod
     def platforms() -> "list[Type[EmotePlatform]]":
         """
@@ -86,21 +101,151 @@ class EmoteManager(abc.ABC):
 
     def __init__(self, channel_id: str):
         self._channel_id = channel_id
-        self._emotes = self._load_emotes()
+        self._platforms = self.platforms()
 
-    def _load_emotes(self) -> dict[str, Emote]:
-        """Loads all emotes from all registered platforms
+        # Latest emotes of every platform, None until it loaded once
+        self._loaded: list[Optional[dict[str, Emote]]] = [None] * len(self._platforms)
+        self._loaded_lock = Lock()
+        # Read-only snapshot of all emotes, replaced whenever a platform loads
+        self._emotes: Mapping[str, Emote] = MappingProxyType({})
 
+    @property
+    def channel_id(self) -> str:
+        """
         Returns:
-            dict[str, Emote]: The emotes loaded
+            str: The ID of the channel the emotes are loaded for
+        """
+
+        return self._channel_id
+
+    def load(self) -> None:
+        """Loads all emotes from all registered platforms at once
+
+        Emotes cached on disk are usable right away, only platforms whose
+        cache is missing or stale get loaded again. The emotes of every
+        platform are usable as soon as it answered. Platforms failing or not
+        answering in time keep the emotes they loaded before, if any.
+        """
+
+        from twitch.emotes.cache import CachedCatalog, EmoteCache
+
+        cache = EmoteCache(self._channel_id) if self.CACHE else None
+        catalogs = cache.read() if cache is not None else {}
+
+        for i, p in enumerate(self._platforms):
+            catalog = catalogs.get(p.__name__, None)
+            if catalog is not None and self._loaded[i] is None:
+                self._publish(i, catalog.emotes)
+
+        stale = [
+            i
+            for i, p in enumerate(self._platforms)
+            if p.__name__ not in catalogs or catalogs[p.__name__].stale
+        ]
+        if not stale:
+            return
+
+        pool = ThreadPoolExecutor(len(stale), thread_name_prefix="EmoteLoader")
+        futures = {}
+        for i in stale:
+            platform = self._platforms[i]
+            catalog = catalogs.get(platform.__name__, None)
+            validators = catalog.validators if catalog is not None else {}
+            futures[pool.submit(self._load_platform, platform, validators)] = i
+
+        try:
+            for future in as_completed(futures, timeout=constants.EMOTE_TIMEOUT):
+                i = futures[future]
+                name = self._platforms[i].__name__
+                error = future.exception()
+
+                if error is None:
+                    emotes, validators = future.result()
+                    self._publish(i, emotes)
+                    catalogs[name] = CachedCatalog(emotes, time.time(), validators)
+                elif isinstance(error, NotModified):
+                    catalogs[name].fetched = time.time()
+        except TimeoutError:
+            for future, i in futures.items():
+                if not future.done():
+                    LOG.warning(f"Emotes from {self._platforms[i].__name__} timed out")
+
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        if cache is not None:
+            cache.write(catalogs)
+
+    def _publish(self, index: int, emotes: dict[str, Emote]) -> None:
+        """Merges the emotes of one platform into a new snapshot
+
+        Emotes of later platforms take precedence over earlier ones of the
+        same name, no matter which platform answered first.
+
+        Args:
+            index (int): The index of the platform in `platforms`
+            emotes (dict[str, Emote]): The emotes the platform loaded
         """
 
-        emotes = {}
+        with self._loaded_lock:
+            self._loaded[index] = emotes
+
+            merged = {}
+            for loaded in self._loaded:
+                if loaded is not None:
+                    merged |= loaded
+
+            self._emotes = MappingProxyType(merged)
+
+    def _load_platform(
+        self, platform: "Type[EmotePlatform]", validators: dict[str, str]
+    ) -> tuple[dict[str, Emote], dict[str, str]]:
+        """Loads the emotes of one platform, logging how long it took
 
-        for p in self.platforms():
-            emotes |= p(self._channel_id).load_emotes()
+        Args:
+            platform (Type[EmotePlatform]): The platform to load emotes from
+            validators (dict[str, str]): The headers to revalidate cached emotes with
+
+        Raises:
+            NotModified: When the cached emotes are still up to date
 
-        return emotes
+        Returns:
+            tuple[dict[str, Emote], dict[str, str]]: The emotes loaded and the
+                headers to revalidate them with later on
+        """
+
+        start = time.perf_counter()
+        instance = platform(self._channel_id, validators)
+
+        try:
+            emotes = instance.load_emotes()
+        except NotModified:
+            LOG.info(f"Cached emotes from {platform.__name__} are up to date")
+            raise
+        except Exception as e:
+            LOG.warning(f"Loading emotes from {platform.__name__} failed: {e}")
+            raise
+
+        LOG.info(
+            f"Loaded {len(emotes)} emotes from {platform.__name__} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return emotes, instance.validators
+
+    @staticmethod
+    def _local_url(url: str) -> str:
+        """Points an emote image at the local proxy caching it
+
+        Args:
+            url (str): The url of the image on its CDN
+
+        Returns:
+            str: The url of the image served by the web server
+        """
+
+        if url.startswith("//"):
+            url = f"https:{url}"
+
+        return f"/emote?url={quote(url, safe='')}"
 
     def _make_text_frag(
         self, emote_string: list[dict[str, str]], text_buffer: list[str]
@@ -133,10 +278,11 @@ class EmoteManager(abc.ABC):
         """
 
         emote_string = []
+        emotes = self._emotes
 
         for f in fragments:
             if f["type"] != "emote":
-                emote_string.append(self._emote_str_part(f["text"]))
+                emote_string.append(self._emote_str_part(f["text"], emotes))
                 continue
 
             emote_id = f["emote"]["id"]
@@ -151,17 +297,20 @@ class EmoteManager(abc.ABC):
                 {
                     "type": "emote",
                     "text": f["text"],
-                    "value": link,
+                    "value": self._local_url(link),
                 }
             )
 
         return emote_string
 
-    def _emote_str_part(self, text: str) -> list[dict[str, str]]:
+    def _emote_str_part(
+        self, text: str, emotes: Mapping[str, Emote]
+    ) -> list[dict[str, str]]:
         """Generates an emote string from a text sequence
 
         Args:
             text (str): The text sequence potentially containing 3rd party emotes
+            emotes (Mapping[str, Emote]): The snapshot of 3rd party emotes to use
 
         Returns:
             list[dict[str, str]]: The emote string constructed from the input text
@@ -173,7 +322,7 @@ class EmoteManager(abc.ABC):
         words = text.split(" ")
 
         for w in words:
-            emote = self._emotes.get(w, None)
+            emote = emotes.get(w, None)
 
             if emote is None:
                 text_buffer.append(w)
@@ -186,7 +335,7 @@ class EmoteManager(abc.ABC):
                 {
                     "type": "emote",
                     "text": w,
-                    "value": f"{emote.cdn}/{emote.files[-1]}",
+                    "value": self._local_url(f"{emote.cdn}/{emote.files[-1]}"),
                 }
             )
 
@@ -197,8 +346,51 @@ class EmoteManager(abc.ABC):
 
 
 class EmotePlatform(abc.ABC):
-    def __init__(self, channel_id: str):
+    def __init__(self, channel_id: str, validators: Optional[dict[str, str]] = None):
         self._channel_id = channel_id
+        # Headers revalidating cached emotes, updated by every response
+        self.validators = validators or {}
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Requests emotes, revalidating the cached ones if possible
+
+        Only GET requests are revalidated, as conditional requests of other
+        methods fail instead of reporting the emotes as unchanged.
+
+        Args:
+            method (str): The HTTP method to use
+            url (str): The url to request
+
+        Raises:
+            NotModified: When the cached emotes are still up to date
+
+        Returns:
+            requests.Response: The response received
+        """
+
+        conditional = method == "GET"
+
+        resp = requests.request(
+            method,
+            url,
+            headers=self.validators if conditional else {},
+            timeout=constants.EMOTE_TIMEOUT,
+            **kwargs,
+        )
+
+        if resp.status_code == 304:
+            raise NotModified()
+
+        self.validators = {}
+        if not conditional:
+            return resp
+
+        if "ETag" in resp.headers:
+            self.validators["If-None-Match"] = resp.headers["ETag"]
+        if "Last-Modified" in resp.headers:
+            self.validators["If-Modified-Since"] = resp.headers["Last-Modified"]
+
+        return resp
 
     @abc.abstractmethod
     def load_emotes(self) -> dict[str, Emote]:
@@ -1,5 +1,4 @@
 from typing import Any
-import requests
 import constants
 from twitch.emotes.emotes import Emote, EmotePlatform
 
@@ -12,7 +11,7 @@ class FrankerFaceZChannel(EmotePlatform):
             dict[str, Emote]: The emotes loaded
         """
 
-        resp = requests.get(f"{constants.FRANKERFACEZ_ROOM}/{self._channel_id}")
+        resp = self._request("GET", f"{constants.FRANKERFACEZ_ROOM}/{self._channel_id}")
         resp.raise_for_status()
 
         sets = resp.json()["sets"]
@@ -47,7 +46,7 @@ class FrankerFaceZChannel(EmotePlatform):
 class FrankerFaceZGlobal(FrankerFaceZChannel):
     def load_emotes(self):
 
-        resp = requests.get(constants.FRANKERFACEZ_GLOBAL)
+        resp = self._request("GET", constants.FRANKERFACEZ_GLOBAL)
         resp.raise_for_status()
 
         sets = resp.json()["sets"]
@@ -1,5 +1,4 @@
 from typing import Any
-import requests
 import constants
 from twitch.emotes.emotes import Emote, EmotePlatform
 
@@ -12,7 +11,8 @@ class SevenTVChannel(EmotePlatform):
             dict[str, Emote]: The emotes loaded
         """
 
-        resp = requests.post(
+        resp = self._request(
+            "POST",
             constants.SEVENTV_GQL,
             json={"query": constants.SEVENTV_QUERY.replace("{{ID}}", self._channel_id)},
         )
@@ -59,8 +59,8 @@ class SevenTVGlobal(SevenTVChannel):
             dict[str, Emote]: The emotes loaded
         """
 
-        resp = requests.post(
-            constants.SEVENTV_GQL, json={"query": constants.SEVENTV_GLOBAL}
+        resp = self._request(
+            "POST", constants.SEVENTV_GQL, json={"query": constants.SEVENTV_GLOBAL}
         )
         resp.raise_for_status()
 
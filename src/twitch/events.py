@@ -14,6 +14,8 @@ from widget.config import Config
 
 
 class TwitchEvent(abc.ABC):
+    SUBSCRIPTION_TYPE: str
+
     def __init__(self):
         self._id: Optional[str] = None
 
@@ -71,7 +73,20 @@ class TwitchEvent(abc.ABC):
         body = req.json()
         sub_data = body["data"][0]
 
-        self._id = sub_data["id"]
+        self.bind(sub_data["id"])
+
+    def bind(self, id: Optional[str]) -> None:
+        """Assigns the subscription ID whose notifications trigger this event
+
+        Args:
+            id (Optional[str]): The subscription ID, None to stop triggering
+        """
+
+        _SUBSCRIPTIONS.pop(self._id, None)
+
+        self._id = id
+        if id is not None:
+            _SUBSCRIPTIONS[id] = self
 
     def delete_event(self) -> None:
         """Deletes the current event"""
@@ -87,16 +102,28 @@ class TwitchEvent(abc.ABC):
             },
         )
 
+        self.bind(None)
+
 
 class ChatReadEvent(TwitchEvent):
+    SUBSCRIPTION_TYPE = "channel.chat.message"
+
     def _create_emote_manager(self, broadcaster_id: str) -> None:
-        """Creates an emote manager for the currently selected broadcaster
+        """Loads the emotes of the currently selected broadcaster
+
+        A new emote manager is used right away while its emotes load. The
+        current one keeps its emotes while reloading the same broadcaster.
 
         Args:
             broadcaster_id (str): The ID of the broadcaster
         """
 
-        Credentials().emote_manager = EmoteManager(broadcaster_id)
+        manager = Credentials().emote_manager
+        if manager is None or manager.channel_id != broadcaster_id:
+            manager = EmoteManager(broadcaster_id)
+            Credentials().emote_manager = manager
+
+        manager.load()
 
     def _register(self):
         """Creating the data to register this event with
@@ -116,7 +143,7 @@ class ChatReadEvent(TwitchEvent):
         ).start()
 
         return {
-            "type": "channel.chat.message",
+            "type": self.SUBSCRIPTION_TYPE,
             "version": "1",
             "condition": {
                 "broadcaster_user_id": broadcaster_id,
@@ -134,6 +161,10 @@ class ChatReadEvent(TwitchEvent):
         ComboManager().read(event["message"]["text"], event["message"]["fragments"])
 
 
+# Registered events by their subscription ID
+_SUBSCRIPTIONS: dict[str, TwitchEvent] = {}
+
+
 class EventTypes(Enum):
     CHAT_READ_EVENT = ChatReadEvent()
 
@@ -160,11 +191,27 @@ class EventTypes(Enum):
             event (dict[str, Any]): The event data to pass along
         """
 
+        evt = _SUBSCRIPTIONS.get(id, None)
+
+        if evt is not None:
+            evt.trigger(event)
+
+    @staticmethod
+    def bind(subscription_type: str, id: str) -> None:
+        """Assigns a subscription ID to an event without registering it
+
+        Used for replaying captured traffic of earlier subscriptions.
+
+        Args:
+            subscription_type (str): The subscription type of the event
+            id (str): The subscription ID to assign
+        """
+
         for _, cls in EventTypes._member_map_.items():
             evt: TwitchEvent = cls.value
 
-            if evt.id == id:
-                evt.trigger(event)
+            if evt.SUBSCRIPTION_TYPE == subscription_type and evt.id != id:
+                evt.bind(id)
 
     @staticmethod
     def re_register() -> None:
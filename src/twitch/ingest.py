@@ -0,0 +1,143 @@
+from collections import deque
+from enum import Enum
+import random
+from threading import Condition
+
+from log import LOG
+from stats import Stats
+
+
+class OverflowPolicy(Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    SAMPLE = "sample"
+
+
+class IngestQueue:
+    """Bounded queue of raw frames between the Twitch WebSocket and their handling
+
+    Only notifications are ever dropped, session and revocation messages are
+    always queued.
+    """
+
+    # Twitch sends `metadata.message_type` first, so it is found at the start
+    NOTIFICATION_MARKER = '"notification"'
+    MARKER_RANGE = 256
+
+    def __init__(self, capacity: int, policy: OverflowPolicy):
+        self._capacity = capacity
+        self._policy = policy
+        self._frames: deque[tuple[str, bool]] = deque()
+        self._lock = Condition()
+        # Notifications seen since the queue overflowed, for reservoir sampling
+        self._overflow_seen = 0
+        self._dropped = 0
+
+    def configure(self, capacity: int, policy: OverflowPolicy) -> None:
+        """Changes the capacity and overflow policy
+
+        Args:
+            capacity (int): The maximum amount of queued frames
+            policy (OverflowPolicy): What to do with frames received while full
+        """
+
+        with self._lock:
+            self._capacity = capacity
+            self._policy = policy
+            self._lock.notify_all()
+
+    def put(self, frame: str) -> None:
+        """Queues a frame, applying the overflow policy when full
+
+        Args:
+            frame (str): The raw frame received from Twitch
+        """
+
+        droppable = self.NOTIFICATION_MARKER in frame[: self.MARKER_RANGE]
+        stats = Stats()
+        stats.incr("ingest_received")
+
+        with self._lock:
+            if droppable and len(self._frames) >= self._capacity:
+                match self._policy:
+                    case OverflowPolicy.BLOCK:
+                        while len(self._frames) >= self._capacity:
+                            self._lock.wait()
+
+                    case OverflowPolicy.DROP_OLDEST:
+                        self._drop_oldest()
+
+                    case OverflowPolicy.SAMPLE:
+                        self._sample(frame)
+                        return
+
+            self._frames.append((frame, droppable))
+            stats.set_max("ingest_max_depth", len(self._frames))
+            self._lock.notify_all()
+
+    def _drop_oldest(self) -> None:
+        """Drops the oldest queued notification to make room for a new one"""
+
+        for i, (_, droppable) in enumerate(self._frames):
+            if droppable:
+                del self._frames[i]
+                self._count_drop()
+                return
+
+    def _sample(self, frame: str) -> None:
+        """Keeps a uniform random sample of all notifications received while full
+
+        The new notification replaces a random queued one with the
+        probability of it being part of the sample, otherwise it is dropped.
+
+        Args:
+            frame (str): The notification received
+        """
+
+        self._overflow_seen += 1
+        self._count_drop()
+
+        slot = random.randrange(self._capacity + self._overflow_seen)
+        if slot < len(self._frames) and self._frames[slot][1]:
+            self._frames[slot] = (frame, True)
+
+    def _count_drop(self) -> None:
+        """Counts a dropped notification, warning when drops start"""
+
+        if self._dropped == 0:
+            LOG.warning(
+                f"Ingest queue full, dropping chat messages ({self._policy.value})"
+            )
+
+        self._dropped += 1
+        Stats().incr("ingest_dropped")
+
+    def get(self) -> str:
+        """Takes the next frame, waiting until one is queued
+
+        Returns:
+            str: The raw frame received from Twitch
+        """
+
+        with self._lock:
+            while not self._frames:
+                if self._dropped > 0:
+                    LOG.warning(f"Ingest queue drained, {self._dropped} dropped")
+                    self._dropped = 0
+                    self._overflow_seen = 0
+
+                self._lock.wait()
+
+            frame, _ = self._frames.popleft()
+            self._lock.notify_all()
+
+            return frame
+
+    @property
+    def depth(self) -> int:
+        """
+        Returns:
+            int: The amount of queued frames
+        """
+
+        return len(self._frames)
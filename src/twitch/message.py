@@ -12,8 +12,9 @@ class TwitchMessage(abc.ABC):
     def __init__(self, json_data: dict[str, Any]):
         self._data = json_data
 
+    @classmethod
     @abc.abstractmethod
-    def message_id(self) -> str:
+    def message_id(cls) -> str:
         """
         Returns:
             str: The ID of the message
@@ -29,7 +30,8 @@ class TwitchMessage(abc.ABC):
 
 
 class TwitchMessageWelcome(TwitchMessage):
-    def message_id(self):
+    @classmethod
+    def message_id(cls):
         """
         Returns:
             str: The ID of the message
@@ -46,7 +48,8 @@ class TwitchMessageWelcome(TwitchMessage):
 
 
 class TwitchMessageKeepAlive(TwitchMessage):
-    def message_id(self):
+    @classmethod
+    def message_id(cls):
         """
         Returns:
             str: The ID of the message
@@ -61,7 +64,8 @@ class TwitchMessageKeepAlive(TwitchMessage):
 
 
 class TwitchMessageNotification(TwitchMessage):
-    def message_id(self):
+    @classmethod
+    def message_id(cls):
         """
         Returns:
             str: The ID of the message
@@ -79,7 +83,8 @@ class TwitchMessageNotification(TwitchMessage):
 
 
 class TwitchMessageReconnect(TwitchMessage):
-    def message_id(self):
+    @classmethod
+    def message_id(cls):
         """
         Returns:
             str: The ID of the message
@@ -96,7 +101,8 @@ class TwitchMessageReconnect(TwitchMessage):
 
 
 class TwitchMessageRevocation(TwitchMessage):
-    def message_id(self):
+    @classmethod
+    def message_id(cls):
         """
         Returns:
             str: The ID of the message
@@ -143,11 +149,16 @@ class MessageTypes(Enum):
         """
 
         msg_type = json_data["metadata"]["message_type"]
+        msg_cls = _HANDLERS.get(msg_type, None)
 
-        for _, cls in MessageTypes._member_map_.items():
-            inst: TwitchMessage = cls.value(json_data)
-            if inst.message_id() == msg_type:
-                inst.handle()
-                break
-        else:
+        if msg_cls is None:
             LOG.warning(f"Could not find handler for {json_data}")
+            return
+
+        msg_cls(json_data).handle()
+
+
+# Message handlers by their message type, built once from all known types
+_HANDLERS: dict[str, Type[TwitchMessage]] = {
+    m.value.message_id(): m.value for m in MessageTypes
+}
@@ -6,6 +6,10 @@ import websocket
 import constants
 from log import LOG
 from singleton import singleton
+from stats import Stats
+from twitch.capture import FrameRecorder
+from twitch.ingest import IngestQueue, OverflowPolicy
+from widget.config import Config
 
 
 @singleton
@@ -13,6 +17,13 @@ class TwitchConn:
     def __init__(self):
         self._ws = self._make_ws(constants.TWITCH_ENDPOINT)
         self._connected: bool = False
+        self._recorder: Optional[FrameRecorder] = None
+
+        cfg = Config()
+        self._ingest = IngestQueue(*self._ingest_settings())
+        cfg.add_change_callback("ingest_queue_size", self._configure_ingest)
+        cfg.add_change_callback("ingest_policy", self._configure_ingest)
+        Stats().add_gauge("ingest_depth", lambda: self._ingest.depth)
 
     def _make_ws(self, url: str) -> websocket.WebSocketApp:
         """Creates the WebSocket for Twitch to callback with
@@ -46,6 +57,19 @@ class TwitchConn:
         self._connected = False
         self._ws.close(status=1000, reason="Closing connection.")
 
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def capture(self, path: str) -> None:
+        """Starts appending every received frame to a capture file
+
+        Args:
+            path (str): The file to write the frames to
+        """
+
+        self._recorder = FrameRecorder(path)
+
     def reconnect(self, reconnect_url: str) -> None:
         """Reconnects the WebSocketApp using the provided URL
 
@@ -57,14 +81,66 @@ class TwitchConn:
         self._ws = self._make_ws(reconnect_url)
         self.run()
 
+    def _ingest_settings(self) -> tuple[int, OverflowPolicy]:
+        """Reads the ingest queue settings, resetting invalid ones to their default
+
+        Returns:
+            tuple[int, OverflowPolicy]: The capacity and overflow policy of the queue
+        """
+
+        cfg = Config()
+
+        capacity = cfg["ingest_queue_size"]
+        if capacity < 1:
+            LOG.warning(f"Invalid ingest queue size {capacity}, using the default")
+            capacity = cfg.reset("ingest_queue_size")
+
+        policy = cfg["ingest_policy"]
+        if policy not in {p.value for p in OverflowPolicy}:
+            LOG.warning(f"Invalid ingest policy `{policy}`, using the default")
+            policy = cfg.reset("ingest_policy")
+
+        return capacity, OverflowPolicy(policy)
+
+    def _configure_ingest(self) -> None:
+        """Applies changed ingest queue settings"""
+
+        self._ingest.configure(*self._ingest_settings())
+
     def _on_message(self, ws: websocket.WebSocket, message: str) -> None:
         """The callback for receiving messages
 
+        Only queues the message, so reading from Twitch never waits on its
+        handling.
+
         Args:
             ws (websocket.WebSocket): The socket receiving the message
             message (str): The message received
         """
 
+        if self._recorder is not None:
+            self._recorder.write(message)
+
+        self._ingest.put(message)
+
+    def ingest_thread(self) -> None:
+        """Starts the thread handling all queued messages"""
+
+        while True:
+            message = self._ingest.get()
+
+            try:
+                self._handle(message)
+            except Exception:
+                LOG.exception("Failed handling message from Twitch")
+
+    def _handle(self, message: str) -> None:
+        """Handles a message received from Twitch
+
+        Args:
+            message (str): The message received
+        """
+
         json_data = json.loads(message)
 
         if "metadata" not in json_data or "payload" not in json_data:
@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Optional
+
+import constants
+from log import LOG
+from singleton import singleton
+
+
+# Types worth compressing, everything else is already compressed or tiny
+COMPRESSIBLE = ("text/", "application/javascript", "application/json")
+
+
+class Asset:
+    def __init__(self, name: str, data: bytes, mtime: float):
+        self.mtime = mtime
+        self.data = data
+        self.mime = mimetypes.guess_type(name)[0] or constants.FALLBACK_MIME
+        self.etag = f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+
+        # Pages and scripts change with updates, so they always get revalidated
+        if self.mime.startswith(("text/", "application/javascript")):
+            self.cache_control = "no-cache"
+        else:
+            self.cache_control = "public, max-age=86400"
+
+        self.gzip: Optional[bytes] = None
+        if self.mime.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(data, mtime=0)
+            if len(compressed) < len(data):
+                self.gzip = compressed
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Checks whether a client already holds the current version
+
+        Args:
+            if_none_match (Optional[str]): The `If-None-Match` header sent
+
+        Returns:
+            bool: Whether the client may use its cached copy
+        """
+
+        if if_none_match is None:
+            return False
+
+        for tag in if_none_match.split(","):
+            tag = tag.strip().removeprefix("W/")
+            if tag == "*" or tag == self.etag:
+                return True
+
+        return False
+
+
+@singleton
+class AssetCache:
+    def __init__(self):
+        self._replacements: dict[str, dict[str, str]] = {}
+        self._assets: dict[str, Asset] = {}
+        # Re-renders assets whose file changed, for working on the web folder
+        self.dev = False
+
+    def load(self, pages: dict[str, dict[str, str]]) -> None:
+        """Renders all pages served into memory
+
+        Args:
+            pages (dict[str, dict[str, str]]): The replacements to apply by file
+                name inside the web folder
+        """
+
+        self._replacements = pages
+
+        for name in pages:
+            if self._render(name) is None:
+                LOG.warning(f"Web asset `{name}` is missing")
+
+    def get(self, name: str) -> Optional[Asset]:
+        """
+        Args:
+            name (str): The name of the file inside the web folder
+
+        Returns:
+            Optional[Asset]: The rendered asset, None if not served or missing
+        """
+
+        asset = self._assets.get(name, None)
+
+        if asset is None or self.dev:
+            return self._render(name, asset)
+
+        return asset
+
+    def _render(self, name: str, current: Optional[Asset] = None) -> Optional[Asset]:
+        """Reads a file and applies its replacements
+
+        Args:
+            name (str): The name of the file inside the web folder
+            current (Optional[Asset], optional): The asset rendered before, kept
+                if the file did not change. Defaults to None.
+
+        Returns:
+            Optional[Asset]: The rendered asset, None if not served or missing
+        """
+
+        replacements = self._replacements.get(name, None)
+        if replacements is None:
+            return None
+
+        path = os.path.join(constants.WEB_DIR, name)
+
+        try:
+            mtime = os.stat(path).st_mtime
+            if current is not None and current.mtime == mtime:
+                return current
+
+            with open(path, "rb") as rf:
+                data = rf.read()
+        except OSError:
+            return None
+
+        for key, replace in replacements.items():
+            data = data.replace(key.encode(), replace.encode())
+
+        asset = Asset(name, data, mtime)
+        self._assets[name] = asset
+
+        return asset
@@ -0,0 +1,168 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
+import os
+from threading import Lock
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import constants
+from log import LOG
+from singleton import singleton
+from stats import Stats
+
+
+@singleton
+class EmoteImageCache:
+    """Emote images fetched from their CDNs, kept on disk up to a total size
+
+    Every file starts with the content type of the image on its own line.
+    The least recently served images are removed first. Concurrent requests
+    for an image not cached yet share a single fetch.
+    """
+
+    def __init__(self):
+        self._dir = constants.EMOTE_IMAGE_DIR
+        os.makedirs(self._dir, exist_ok=True)
+
+        # Sizes of the cached files, least recently served first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+        # Fetches in progress by file name, awaited by requests for the same image
+        self._fetching: dict[str, Future[Optional[tuple[bytes, str]]]] = {}
+        self._lock = Lock()
+
+        entries = [e for e in os.scandir(self._dir) if e.is_file()]
+        for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if e.name.endswith(".tmp"):
+                os.remove(e.path)
+                continue
+
+            self._files[e.name] = e.stat().st_size
+            self._size += e.stat().st_size
+
+    @staticmethod
+    def allowed(url: str) -> bool:
+        """
+        Args:
+            url (str): The url of the image
+
+        Returns:
+            bool: Whether the url points to a known emote CDN
+        """
+
+        parts = urlsplit(url)
+        return parts.scheme in ("http", "https") and (
+            parts.hostname in constants.EMOTE_HOSTS
+        )
+
+    def get(self, url: str) -> Optional[tuple[bytes, str]]:
+        """Gets an image from the cache, fetching it on a miss
+
+        Args:
+            url (str): The url of the image on its CDN
+
+        Returns:
+            Optional[tuple[bytes, str]]: The image and its content type, None if
+                it could not be fetched
+        """
+
+        key = hashlib.sha256(url.encode()).hexdigest()
+        path = os.path.join(self._dir, key)
+
+        with self._lock:
+            cached = key in self._files
+            if cached:
+                self._files.move_to_end(key)
+
+        if cached:
+            try:
+                with open(path, "rb") as rf:
+                    content_type = rf.readline().decode().strip()
+                    data = rf.read()
+
+                os.utime(path)
+                Stats().incr("emote_cache_hits")
+                return data, content_type
+            except OSError:
+                pass  # Removed in the meantime, fetch it again
+
+        with self._lock:
+            pending = self._fetching.get(key, None)
+            owner = pending is None
+            if owner:
+                pending = self._fetching[key] = Future()
+
+        if not owner:
+            Stats().incr("emote_cache_joined")
+            return pending.result()
+
+        Stats().incr("emote_cache_misses")
+        image = None
+
+        try:
+            image = self._fetch(url, key, path)
+        finally:
+            with self._lock:
+                del self._fetching[key]
+            pending.set_result(image)
+
+        return image
+
+    def _fetch(self, url: str, key: str, path: str) -> Optional[tuple[bytes, str]]:
+        """Fetches an image from its CDN and stores it
+
+        Args:
+            url (str): The url of the image on its CDN
+            key (str): The name of the file in the cache
+            path (str): The path of the file in the cache
+
+        Returns:
+            Optional[tuple[bytes, str]]: The image and its content type, None if
+                it could not be fetched
+        """
+
+        try:
+            resp = requests.get(url, timeout=constants.EMOTE_TIMEOUT)
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            LOG.warning(f"Could not fetch emote {url}: {e}")
+            return None
+
+        data = resp.content
+        content_type = resp.headers.get("Content-Type", constants.FALLBACK_MIME)
+        header = content_type.encode() + b"\n"
+        tmp = f"{path}.{id(data)}.tmp"
+
+        try:
+            with open(tmp, "wb") as wf:
+                wf.write(header)
+                wf.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            LOG.warning(f"Could not cache emote {url}: {e}")
+            return data, content_type
+
+        with self._lock:
+            self._size += len(header) + len(data) - self._files.pop(key, 0)
+            self._files[key] = len(header) + len(data)
+            self._evict()
+
+        return data, content_type
+
+    def _evict(self) -> None:
+        """Removes the least recently served images until the cache fits
+
+        The lock must be held.
+        """
+
+        while self._size > constants.EMOTE_IMAGE_CACHE_SIZE and len(self._files) > 1:
+            key, size = self._files.popitem(last=False)
+            self._size -= size
+
+            try:
+                os.remove(os.path.join(self._dir, key))
+            except OSError:
+                pass
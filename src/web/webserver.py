@@ -1,21 +1,227 @@
-from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
-import mimetypes
-import os
-from urllib.parse import quote
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import json
+from queue import Full, Queue
+import selectors
+import socket
+from threading import Lock, Thread
+import time
+from urllib.parse import quote, unquote
 
 import constants
 from log import LOG
+from stats import Stats
 from twitch.credentials import Credentials
 from twitch.twitch import TwitchConn
-from widget.widget_comm import CommServer
+from web.assets import AssetCache
+from web.emote_proxy import EmoteImageCache
+from widget.widget_comm import CommServer, Topic
+
+
+AUTH_REPLACEMENTS = {
+    "{{CLIENT_ID}}": quote(constants.CLIENT_ID),
+    "{{REDIRECT_URI}}": quote(constants.AUTH_REDIR),
+    "{{SCOPE}}": quote(constants.SCOPE),
+}
+WS_REPLACEMENTS = {"{{WS_PORT}}": str(constants.HTTP_PORT + 1)}
+
+# Files inside the web folder served, with the variables replaced in them
+ASSETS: dict[str, dict[str, str]] = {
+    "authorize_frag.html": {},
+    "authorized.html": {},
+    "widget.html": {},
+    "widget.js": WS_REPLACEMENTS,
+    "widget.css": {},
+    "passero_one/PasseroOne.ttf": {},
+    "dashboard.html": AUTH_REPLACEMENTS,
+    "dashboard.js": WS_REPLACEMENTS,
+    "dashboard.css": {},
+    "favicon.ico": {},
+}
+
+PAGES: dict[str, str] = {
+    "/widget": "widget.html",
+    "/widget.js": "widget.js",
+    "/widget.css": "widget.css",
+    "/PasseroOne.ttf": "passero_one/PasseroOne.ttf",
+    "/dashboard": "dashboard.html",
+    "/dashboard.js": "dashboard.js",
+    "/dashboard.css": "dashboard.css",
+    "/favicon.ico": "favicon.ico",
+}
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server handling connections on a fixed amount of worker threads
+
+    Connections arriving while the queue is full are turned away with 503.
+    Idle keep-alive connections are parked in a selector instead of holding
+    on to a worker, and queued again once their next request arrives.
+    """
+
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._requests: Queue[tuple[socket.socket, tuple[str, int]]] = Queue(
+            constants.HTTP_QUEUE
+        )
+
+        self._idle = selectors.DefaultSelector()
+        self._parked: list[tuple[socket.socket, tuple[str, int]]] = []
+        self._parked_lock = Lock()
+        self._wakeup_recv, self._wakeup = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup.setblocking(False)
+        self._idle.register(self._wakeup_recv, selectors.EVENT_READ, None)
+
+        Thread(target=self._idle_thread, name="WebIdle", daemon=True).start()
+        for i in range(constants.HTTP_WORKERS):
+            Thread(target=self._worker, name=f"WebWorker{i}", daemon=True).start()
+
+    def process_request(
+        self, request: socket.socket, client_address: tuple[str, int]
+    ) -> None:
+        """Queues a connection for the next free worker
+
+        Args:
+            request (socket.socket): The connection accepted
+            client_address (tuple[str, int]): The address of the client
+        """
+
+        try:
+            self._requests.put_nowait((request, client_address))
+        except Full:
+            Stats().incr("http_rejected")
+            try:
+                request.sendall(
+                    b"HTTP/1.1 503 Service Unavailable\r\n"
+                    b"Content-Length: 0\r\nConnection: close\r\n\r\n"
+                )
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def _worker(self) -> None:
+        """Starts a worker thread handling queued connections"""
+
+        while True:
+            request, client_address = self._requests.get()
+            parked = False
+
+            try:
+                handler = self.RequestHandlerClass(request, client_address, self)
+                parked = handler.parked
+            except Exception:
+                self.handle_error(request, client_address)
+
+            if parked:
+                self._park(request, client_address)
+            else:
+                self.shutdown_request(request)
+
+    def _park(self, request: socket.socket, client_address: tuple[str, int]) -> None:
+        """Hands an idle keep-alive connection over to the idle thread
+
+        Args:
+            request (socket.socket): The idle connection
+            client_address (tuple[str, int]): The address of the client
+        """
+
+        with self._parked_lock:
+            self._parked.append((request, client_address))
+
+        try:
+            self._wakeup.send(b"\0")
+        except BlockingIOError:
+            pass  # The idle thread is already being woken up
+
+    def _idle_thread(self) -> None:
+        """Starts the thread watching idle keep-alive connections
+
+        Connections sending their next request are queued for a worker again,
+        those staying idle for too long get closed.
+        """
+
+        while True:
+            for key, _ in self._idle.select(1.0):
+                if key.data is None:
+                    self._register_parked()
+                    continue
+
+                self._idle.unregister(key.fileobj)
+                self.process_request(key.fileobj, key.data[0])
+
+            now = time.time()
+            for key in list(self._idle.get_map().values()):
+                if key.data is not None and key.data[1] < now:
+                    self._idle.unregister(key.fileobj)
+                    self.shutdown_request(key.fileobj)
+
+    def _register_parked(self) -> None:
+        """Starts watching the connections parked since the last wakeup"""
+
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        with self._parked_lock:
+            parked = self._parked
+            self._parked = []
+
+        deadline = time.time() + constants.HTTP_KEEPALIVE
+        for request, client_address in parked:
+            self._idle.register(
+                request, selectors.EVENT_READ, (client_address, deadline)
+            )
 
 
 class HTTPHandler(BaseHTTPRequestHandler):
+    # Keep connections open for the assets of a page loaded after another
+    protocol_version = "HTTP/1.1"
+    # Seconds to wait for a request to arrive in full
+    timeout = constants.HTTP_KEEPALIVE
+    # Whether the connection is idle and waits for its next request
+    parked = False
+
+    def handle(self) -> None:
+        """Handles requests until the connection is closed or goes idle"""
+
+        while True:
+            self.handle_one_request()
+
+            if self.close_connection:
+                return
+
+            if not self._request_waiting():
+                self.parked = True
+                return
+
+    def _request_waiting(self) -> bool:
+        """Checks without blocking whether the client sent its next request
+
+        Returns:
+            bool: Whether data of another request is available
+        """
+
+        self.connection.setblocking(False)
+
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
     @staticmethod
     def start_server() -> None:
         """Starts the HTTP server"""
 
-        with ThreadingHTTPServer(
+        AssetCache().load(ASSETS)
+
+        with PooledHTTPServer(
             ("localhost", constants.HTTP_PORT), HTTPHandler
         ) as httpd:
             LOG.info(f"Serving on http://localhost:{constants.HTTP_PORT}")
@@ -62,19 +268,19 @@ class HTTPHandler(BaseHTTPRequestHandler):
 
         return path, params
 
-    def _send_page(
-        self, page_name: str, replacements: dict[bytes | str, bytes | str] = {}
-    ) -> None:
-        """Sends a static page with replaced variables
+    def _send_page(self, page_name: str) -> None:
+        """Sends a static page rendered by the asset cache
+
+        Answers conditional requests for an unchanged page with 304 and sends
+        the compressed variant to clients accepting it.
 
         Args:
             page_name (str): The name of the file inside the web folder
-            replacements (dict[bytes  |  str, bytes  |  str], optional): The replacements to use. Defaults to {}.
         """
 
-        path = os.path.join(constants.WEB_DIR, page_name)
+        asset = AssetCache().get(page_name)
 
-        if not os.path.isfile(path):
+        if asset is None:
             self.send_error(
                 404,
                 "Not Found",
@@ -82,23 +288,55 @@ class HTTPHandler(BaseHTTPRequestHandler):
             )
             return
 
-        with open(path, "rb") as rf:
-            data = rf.read()
+        if asset.matches(self.headers.get("If-None-Match", None)):
+            self.send_response(304, "Not Modified")
+            self.send_header("ETag", asset.etag)
+            self.send_header("Cache-Control", asset.cache_control)
+            self.end_headers()
+            return
+
+        data = asset.data
+        compress = asset.gzip is not None and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        )
 
-        for key, replace in replacements.items():
-            if isinstance(key, str):
-                key = key.encode()
+        self.send_response(200, "OK")
+        self.send_header("Content-Type", asset.mime)
+        self.send_header("ETag", asset.etag)
+        self.send_header("Cache-Control", asset.cache_control)
+        if asset.gzip is not None:
+            self.send_header("Vary", "Accept-Encoding")
+        if compress:
+            data = asset.gzip
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
 
-            if isinstance(replace, str):
-                replace = replace.encode()
+        self.wfile.write(data)
 
-            data = data.replace(key, replace)
+    def _send_emote(self, url: str) -> None:
+        """Sends an emote image from the local cache
+
+        Args:
+            url (str): The url of the image on its CDN
+        """
+
+        cache = EmoteImageCache()
+        if not cache.allowed(url):
+            self.send_error(403, "Forbidden", "Only emote CDNs are proxied")
+            return
+
+        image = cache.get(url)
+        if image is None:
+            self.send_error(502, "Bad Gateway", "The emote could not be fetched")
+            return
+
+        data, content_type = image
 
         self.send_response(200, "OK")
-        self.send_header(
-            "Content-Type",
-            mimetypes.guess_type(page_name)[0] or constants.FALLBACK_MIME,
-        )
+        self.send_header("Content-Type", content_type)
+        # Emote urls never change their image
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
         self.send_header("Content-Length", str(len(data)))
         self.end_headers()
 
@@ -124,6 +362,7 @@ class HTTPHandler(BaseHTTPRequestHandler):
 
             self.send_response(302, "Not authorized")
             self.send_header("Location", "/")
+            self.send_header("Content-Length", "0")
             self.end_headers()
             return
 
@@ -134,7 +373,8 @@ class HTTPHandler(BaseHTTPRequestHandler):
             {
                 "event": "connect",
                 "data": {"connected": True},
-            }
+            },
+            Topic.CONNECT,
         )
 
         self._send_page("authorized.html")
@@ -144,35 +384,6 @@ class HTTPHandler(BaseHTTPRequestHandler):
 
         path, params = self._split_path()
 
-        PAGES: dict[str, tuple[str] | tuple[str, dict[str | bytes, str | bytes]]] = {
-            "/": (
-                "index.html",
-                {
-                    "{{CLIENT_ID}}": quote(constants.CLIENT_ID),
-                    "{{REDIRECT_URI}}": quote(constants.AUTH_REDIR),
-                    "{{SCOPE}}": quote(constants.SCOPE),
-                },
-            ),
-            "/widget": ("widget.html",),
-            "/widget.js": ("widget.js", {"{{WS_PORT}}": str(constants.HTTP_PORT + 1)}),
-            "/widget.css": ("widget.css",),
-            "/PasseroOne.ttf": ("passero_one/PasseroOne.ttf",),
-            "/dashboard": (
-                "dashboard.html",
-                {
-                    "{{CLIENT_ID}}": quote(constants.CLIENT_ID),
-                    "{{REDIRECT_URI}}": quote(constants.AUTH_REDIR),
-                    "{{SCOPE}}": quote(constants.SCOPE),
-                },
-            ),
-            "/dashboard.js": (
-                "dashboard.js",
-                {"{{WS_PORT}}": str(constants.HTTP_PORT + 1)},
-            ),
-            "/dashboard.css": ("dashboard.css",),
-            "/favicon.ico": ("favicon.ico",),
-        }
-
         match path:
             case "/":
                 self.send_response(302, "Redirect")
@@ -180,6 +391,7 @@ class HTTPHandler(BaseHTTPRequestHandler):
                     "Location",
                     "https://github.com/JoaStuart/chatwidget?tab=readme-ov-file#2-add-the-dashboard-to-obs",
                 )
+                self.send_header("Content-Length", "0")
                 self.end_headers()
 
             case "/authorized":
@@ -187,7 +399,20 @@ class HTTPHandler(BaseHTTPRequestHandler):
 
             case "/reconnect":
                 self.send_response(200, "OK")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            case "/emote":
+                self._send_emote(unquote(params.get("url", "")))
+
+            case "/stats":
+                data = json.dumps(Stats().dump()).encode()
+
+                self.send_response(200, "OK")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
                 self.end_headers()
+                self.wfile.write(data)
 
             case _:
                 page = PAGES.get(path, None)
@@ -198,4 +423,4 @@ class HTTPHandler(BaseHTTPRequestHandler):
                     )
                     return
 
-                self._send_page(*page)
+                self._send_page(page)
@@ -0,0 +1,145 @@
+import json
+import time
+from threading import Condition, Lock
+from typing import Any
+
+from log import LOG
+from singleton import singleton
+from widget.config import Config
+from widget.widget_comm import CommServer, Topic
+
+
+@singleton
+class ComboBroadcaster:
+    def __init__(self):
+        self._pending: list[dict[str, Any]] = []
+        self._latest: dict[int, dict[str, Any]] = {}
+        self._lock = Condition()
+
+        # Combos shown in the widget by id and the sequence number of the last
+        # batch changing them, guarded by `_state_lock` to stay in line with the
+        # batches sent
+        self._active: dict[int, dict[str, Any]] = {}
+        self._seq = 0
+        self._state_lock = Lock()
+
+    def push(self, message: dict[str, Any]) -> None:
+        """Queues a combo event to be sent with the next flush
+
+        Updates of a combo still pending are merged into the pending event,
+        so only its latest count gets sent.
+
+        Args:
+            message (dict[str, Any]): The combo event to send
+        """
+
+        combo_id = message["data"]["id"]
+
+        with self._lock:
+            if message["event"] == "combo_update":
+                pending = self._latest.get(combo_id, None)
+                if pending is not None:
+                    pending["data"]["combo"] = message["data"]["combo"]
+                    return
+
+            self._pending.append(message)
+
+            if message["event"] == "combo_remove":
+                self._latest.pop(combo_id, None)
+            else:
+                self._latest[combo_id] = message
+
+            self._lock.notify()
+
+    def prefetch(self, urls: list[str]) -> None:
+        """Sends emotes for the widget to load before their combo is shown
+
+        Prefetches do not change any combo, so they are sent right away
+        outside of the sequenced batches and may be dropped.
+
+        Args:
+            urls (list[str]): The urls of the emote images
+        """
+
+        CommServer.broadcast(
+            {"event": "combo_prefetch", "data": {"urls": urls}},
+            Topic.COMBO,
+            droppable=True,
+        )
+
+    def flush_thread(self) -> None:
+        """Starts the thread sending all queued combo events once per tick"""
+
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+
+                batch = self._pending
+                self._pending = []
+                self._latest.clear()
+
+            # Slow widgets may lose batches of only updates, noticing the gap in
+            # the sequence and resyncing
+            droppable = all(m["event"] == "combo_update" for m in batch)
+
+            try:
+                with self._state_lock:
+                    self._apply(batch)
+                    self._seq += 1
+
+                    CommServer.broadcast(
+                        {"event": "batch", "seq": self._seq, "data": batch},
+                        Topic.COMBO,
+                        droppable,
+                    )
+            except Exception:
+                LOG.exception("Failed broadcasting combo events")
+
+            time.sleep(1 / max(1, Config()["broadcast_rate"]))
+
+    def _apply(self, batch: list[dict[str, Any]]) -> None:
+        """Applies a batch to the combos shown in the widget
+
+        Args:
+            batch (list[dict[str, Any]]): The combo events being sent
+        """
+
+        for message in batch:
+            data = message["data"]
+
+            match message["event"]:
+                case "combo_create":
+                    self._active[data["id"]] = dict(data)
+                case "combo_update":
+                    self._active[data["id"]]["combo"] = data["combo"]
+                case "combo_remove":
+                    self._active.pop(data["id"], None)
+
+    def send_snapshot(self, connection: CommServer, register: bool = False) -> None:
+        """Sends all combos shown in the widget to a connection
+
+        Every batch has the next sequence number, so widgets detect dropped
+        batches by a gap in the sequence and resync with a snapshot. The
+        snapshot is queued in line with the batches, so it covers exactly
+        those up to its sequence number.
+
+        Args:
+            connection (CommServer): The connection to send the snapshot to
+            register (bool, optional): Whether to start broadcasting to the
+                connection right after its snapshot. Defaults to False.
+        """
+
+        with self._state_lock:
+            connection.send(
+                json.dumps(
+                    {
+                        "event": "snapshot",
+                        "seq": self._seq,
+                        "data": list(self._active.values()),
+                    }
+                )
+            )
+
+            if register:
+                connection.register()
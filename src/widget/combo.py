@@ -1,16 +1,44 @@
+from collections import OrderedDict
+from enum import Enum
+import heapq
+import itertools
+from queue import Empty, Queue
 import time
-from typing import Any
+from typing import Any, Optional
 
+from log import LOG
 from singleton import singleton
+from stats import Stats
 from twitch.credentials import Credentials
+from widget.broadcast import ComboBroadcaster
 from widget.config import Config
-from widget.widget_comm import CommServer
+
+
+class ComboEvent(Enum):
+    INGEST = 0
+    CONFIG = 1
 
 
 @singleton
 class ComboManager:
     def __init__(self):
-        self._combos: list[ChatCombo] = []
+        self._events: Queue[tuple[ComboEvent, tuple[Any, ...]]] = Queue()
+
+        # State below is only ever touched by the combo thread
+        self._combos: dict[str, ChatCombo] = {}
+        self._expiry: list[tuple[float, str]] = []
+        self._active_combos = 0
+        # Ids identifying active combos to the widget, never reused
+        self._combo_ids = itertools.count()
+        self._settings = self._load_settings()
+        self._candidates = CandidateTracker(self._settings["combo_candidates"])
+
+        Stats().add_gauge("candidate_error", lambda: self._candidates.error_bound)
+        Stats().add_gauge("candidate_evictions", lambda: self._candidates.evictions)
+
+        cfg = Config()
+        for key in self._settings:
+            cfg.add_change_callback(key, self._config_changed)
 
     def read(self, message: str, fragments: list[dict[str, Any]]) -> None:
         """Reads in a message received from chat
@@ -20,119 +48,444 @@ class ComboManager:
             fragments (list[dict[str, Any]]): The message fragmented by Twitch
         """
 
-        if self._add_to_existing(message):
+        self._events.put((ComboEvent.INGEST, (message, fragments)))
+
+    def _config_changed(self) -> None:
+        """Callback for when a config value used by the combo thread changes"""
+
+        self._events.put((ComboEvent.CONFIG, ()))
+
+    def _load_settings(self) -> dict[str, Any]:
+        """Loads the config values used by the combo thread
+
+        Returns:
+            dict[str, Any]: The config values by key
+        """
+
+        cfg = Config()
+        keys = (
+            "combo_threshold",
+            "max_combo",
+            "combo_timeout",
+            "combo_candidates",
+            "prefetch_level",
+        )
+        return {k: cfg[k] for k in keys}
+
+    def combo_thread(self) -> None:
+        """Starts the thread owning all combo state
+
+        Handles incoming messages and config changes in order and times out
+        combos once their deadline passes.
+        """
+
+        while True:
+            timeout = None
+            if self._expiry:
+                timeout = max(0.0, self._expiry[0][0] - time.time())
+
+            try:
+                event, args = self._events.get(timeout=timeout)
+            except Empty:
+                pass
+            else:
+                try:
+                    self._handle(event, args)
+                except Exception:
+                    LOG.exception(f"Failed handling combo event {event.name}")
+
+            try:
+                self._expire_due(time.time())
+            except Exception:
+                LOG.exception("Failed expiring combos")
+
+    def _handle(self, event: ComboEvent, args: tuple[Any, ...]) -> None:
+        """Handles one event queued for the combo thread
+
+        Args:
+            event (ComboEvent): The type of the event
+            args (tuple[Any, ...]): The arguments of the event
+        """
+
+        match event:
+            case ComboEvent.INGEST:
+                self._ingest(*args)
+            case ComboEvent.CONFIG:
+                self._settings = self._load_settings()
+                self._candidates.resize(self._settings["combo_candidates"])
+
+    def _ingest(self, message: str, fragments: list[dict[str, Any]]) -> None:
+        """Adds a message to its combo
+
+        Messages without a combo are counted by the candidate tracker until
+        they repeat often enough to become one.
+
+        Args:
+            message (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+        """
+
+        key = ChatCombo.make_key(message)
+        combo = self._combos.get(key, None)
+        timeout = self._settings["combo_timeout"]
+
+        if combo is None:
+            combo = self._promote(key, message, fragments, timeout)
+            if combo is None:
+                return
+        else:
+            combo.add_entry(timeout)
+
+        if combo.entries < self._settings["combo_threshold"]:
             return
 
-        self._combos.append(ChatCombo(message, fragments))
+        if combo.active:
+            combo.update_combo()
+        elif self._active_combos < self._settings["max_combo"]:
+            combo.activate(next(self._combo_ids))
+            self._active_combos += 1
+
+    def _promote(
+        self,
+        key: str,
+        message: str,
+        fragments: list[dict[str, Any]],
+        timeout: float,
+    ) -> "Optional[ChatCombo]":
+        """Counts a message without a combo and creates one once it repeats enough
 
-    def _add_to_existing(self, message: str) -> bool:
-        """Tries to add the message to an existing combo
+        Args:
+            key (str): The normalized key of the message
+            message (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+            timeout (float): Seconds after which the message is forgotten
+
+        Returns:
+            Optional[ChatCombo]: The created combo, None if the message is still a candidate
+        """
+
+        was_full = self._candidates.full
+        entries = self._candidates.add(key, message, fragments, timeout)
+
+        if self._candidates.full and not was_full:
+            error = self._candidates.error_bound
+            LOG.debug(f"Combo candidate tracker full, estimated error {error}")
+
+        threshold = self._settings["combo_threshold"]
+        level = self._settings["prefetch_level"]
+        # Prefetching single messages would load the emotes of all of chat
+        if level > 0 and entries == threshold - level and entries > 1:
+            ChatCombo.prefetch(message, fragments)
+
+        if entries < threshold:
+            return None
+
+        candidate = self._candidates.pop(key)
+        combo = ChatCombo(candidate.text, candidate.fragments, timeout, entries)
+        self._combos[key] = combo
+        heapq.heappush(self._expiry, (combo.expires, key))
+
+        return combo
+
+    def _expire_due(self, cur_time: float) -> None:
+        """Removes all combos whose deadline has passed
+
+        Combos extended by new entries since being scheduled are lazily
+        re-inserted with their new expiry time.
+
+        Args:
+            cur_time (float): The current time
+        """
+
+        while self._expiry and self._expiry[0][0] <= cur_time:
+            _, key = heapq.heappop(self._expiry)
+
+            combo = self._combos.get(key, None)
+            if combo is None:
+                continue
+
+            if combo.expires > cur_time:
+                heapq.heappush(self._expiry, (combo.expires, key))
+                continue
+
+            if combo.active:
+                combo.remove_combo()
+                self._active_combos -= 1
+
+            del self._combos[key]
+
+
+class ComboCandidate:
+    def __init__(self, text: str, fragments: list[dict[str, Any]], count: int):
+        self.text = text
+        self.fragments = fragments
+        self.count = count
+        self.error = count - 1
+        self.expires = 0.0
+
+
+class CandidateTracker:
+    """Space-Saving counter of messages that have not become a combo yet
+
+    Keeps at most `capacity` counters, at least one. When full, the counter
+    of an expired message or otherwise the least frequent one is taken over
+    by the new message, inheriting its count as possible overestimation.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = max(1, capacity)
+        # Ordered by last entry, so the first counter expires first
+        self._counters: OrderedDict[str, ComboCandidate] = OrderedDict()
+        # Lazy min-heap of (count, key), outdated entries are skipped on pop
+        self._by_count: list[tuple[int, str]] = []
+        self._evictions = 0
+
+    def add(
+        self, key: str, text: str, fragments: list[dict[str, Any]], timeout: float
+    ) -> int:
+        """Counts one occurrence of a message
 
         Args:
-            message (str): The text form of the message
+            key (str): The normalized key of the message
+            text (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+            timeout (float): Seconds after which the message is forgotten
 
         Returns:
-            bool: Whether an existing combo has been found for the message
+            int: The guaranteed count of the message
         """
 
-        found = False
+        cur_time = time.time()
+        candidate = self._counters.get(key, None)
 
-        for c in self._combos:
-            if c.compare(message):
-                c.add_entry()
-                found = True
+        if candidate is None or candidate.expires < cur_time:
+            candidate = self._make_room(key, text, fragments, cur_time)
+        else:
+            candidate.count += 1
+            self._counters.move_to_end(key)
 
-        return found
+        candidate.expires = cur_time + timeout
+        heapq.heappush(self._by_count, (candidate.count, key))
 
-    def combo_thread(self) -> None:
-        """Starts the thread for timing out combos"""
+        if len(self._by_count) > 4 * self._capacity:
+            self._by_count = [(c.count, k) for k, c in self._counters.items()]
+            heapq.heapify(self._by_count)
+
+        return candidate.count - candidate.error
+
+    def _make_room(
+        self, key: str, text: str, fragments: list[dict[str, Any]], cur_time: float
+    ) -> ComboCandidate:
+        """Creates a counter for a message, evicting another one if needed
+
+        Args:
+            key (str): The normalized key of the message
+            text (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+            cur_time (float): The current time
+
+        Returns:
+            ComboCandidate: The new counter
+        """
+
+        self._counters.pop(key, None)
+        count = 1
+
+        if len(self._counters) >= self._capacity:
+            oldest = next(iter(self._counters.values()))
+
+            if oldest.expires < cur_time:
+                self._counters.popitem(last=False)
+            else:
+                victim = self._pop_min()
+                count = victim.count + 1
+
+            self._evictions += 1
+
+        candidate = ComboCandidate(text, fragments, count)
+        self._counters[key] = candidate
+
+        return candidate
+
+    def _pop_min(self) -> ComboCandidate:
+        """Removes the counter with the lowest count
+
+        Returns:
+            ComboCandidate: The removed counter
+        """
 
         while True:
-            time.sleep(0.5)
-            cur_time = time.time()
+            count, key = heapq.heappop(self._by_count)
+            candidate = self._counters.get(key, None)
 
-            for c in self._combos.copy():
-                if c.expires < cur_time:
-                    c.remove_combo()
-                    self._combos.remove(c)
+            if candidate is not None and candidate.count == count:
+                del self._counters[key]
+                return candidate
 
+    def pop(self, key: str) -> ComboCandidate:
+        """Stops tracking a message
 
-class ChatCombo:
-    ACTIVE_COMBOS = 0
+        Args:
+            key (str): The normalized key of the message
 
-    def __init__(self, text: str, fragments: list[dict[str, Any]]):
-        self._text = text
-        self._fragments = fragments
-        self._entries = 1
-        self._expires = self._make_expiry()
-        self._active = False
+        Returns:
+            ComboCandidate: The counter of the message
+        """
+
+        return self._counters.pop(key)
+
+    def resize(self, capacity: int) -> None:
+        """Changes the maximum amount of counters, evicting the oldest ones
+
+        Args:
+            capacity (int): The new maximum amount of counters, at least one
+        """
+
+        self._capacity = max(1, capacity)
 
-    def _make_expiry(self) -> float:
+        while len(self._counters) > self._capacity:
+            self._counters.popitem(last=False)
+            self._evictions += 1
+
+    @property
+    def full(self) -> bool:
+        """
+        Returns:
+            bool: Whether adding a new message evicts another one
+        """
+
+        return len(self._counters) >= self._capacity
+
+    @property
+    def error_bound(self) -> int:
         """
         Returns:
-            float: The time after which the combo expires
+            int: By how much the count of a newly tracked message may be overestimated
         """
 
-        return time.time() + Config()["combo_timeout"]
+        # Copied at once, as stats are read while the combo thread counts
+        counters = list(self._counters.values())
+
+        if len(counters) < self._capacity or not counters:
+            return 0
+
+        return min(c.count for c in counters)
+
+    @property
+    def evictions(self) -> int:
+        """
+        Returns:
+            int: Count of counters taken over by other messages
+        """
+
+        return self._evictions
+
+
+class ChatCombo:
+    # Punctuation ignored when comparing messages containing spaces
+    PUNCTUATION = str.maketrans("", "", ".,!?:")
+    # Invisible characters appended by 7TV to bypass Twitch's duplicate message check
+    BYPASS_CHARS = str.maketrans("", "", "\U000e0000\u034f\u200b\u200c\u200d\u2060")
+
+    def __init__(
+        self,
+        text: str,
+        fragments: list[dict[str, Any]],
+        timeout: float,
+        entries: int = 1,
+    ):
+        self._text = text
+        self._fragments = fragments
+        self._entries = entries
+        self._expires = time.time() + timeout
+        self._id: Optional[int] = None
 
-    def compare(self, message: str) -> bool:
-        """Compares the current message with the given one
+    @staticmethod
+    def make_key(message: str) -> str:
+        """Normalizes a message into the key combos are matched by
 
         Args:
-            message (str): The message to compare to
+            message (str): The message to normalize
 
         Returns:
-            bool: Whether the messages match
+            str: The key of the message
         """
 
+        message = message.translate(ChatCombo.BYPASS_CHARS).strip()
+
         if " " in message:
-            removal = [".", ",", "!", "?", ":"]
-            c_str = self.text
-            m_str = message
-            for c in removal:
-                c_str = c_str.replace(c, "")
-                m_str = m_str.replace(c, "")
-
-            return c_str.lower() == m_str.lower()
-        else:
-            return self.text.lower() == message.lower()
+            message = message.translate(ChatCombo.PUNCTUATION)
+
+        return message.casefold()
 
-    def add_entry(self) -> None:
-        """Adds one entry to the current combo"""
+    def add_entry(self, timeout: float) -> None:
+        """Adds one entry to the current combo
+
+        Args:
+            timeout (float): Seconds after which the combo expires from now
+        """
 
         self._entries += 1
-        self._expires = self._make_expiry()
+        self._expires = time.time() + timeout
 
-        if self._entries < Config()["combo_threshold"]:
-            return
+    def activate(self, combo_id: int) -> None:
+        """Activates the current combo
 
-        if self._active:
-            self._update_combo()
-        else:
-            self._activate()
+        Args:
+            combo_id (int): The id identifying the combo to the browser
+        """
+
+        self._id = combo_id
+        self._create_combo()
+
+    @staticmethod
+    def make_emote_string(
+        text: str, fragments: list[dict[str, Any]]
+    ) -> list[dict[str, str]]:
+        """Generates the emote string of a message, falling back to plain text
+
+        Args:
+            text (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+
+        Returns:
+            list[dict[str, str]]: The emote string to send to the widget
+        """
+
+        if Credentials().emote_manager is not None:
+            return Credentials().emote_manager.make_emote_string(fragments)
+
+        return [{"type": "text", "value": text}]
+
+    @staticmethod
+    def prefetch(text: str, fragments: list[dict[str, Any]]) -> None:
+        """Sends the emotes of a message about to become a combo to the browser
 
-    def _activate(self) -> None:
-        """Activates the current combo"""
+        Args:
+            text (str): The message in text form
+            fragments (list[dict[str, Any]]): The message fragmented by Twitch
+        """
 
-        if self.ACTIVE_COMBOS < Config()["max_combo"]:
-            self._active = True
-            self._create_combo()
-            self.ACTIVE_COMBOS += 1
+        urls = []
+        for part in ChatCombo.make_emote_string(text, fragments):
+            # Text fragments turn into lists of parts of their own
+            for p in part if isinstance(part, list) else [part]:
+                if p["type"] == "emote":
+                    urls.append(p["value"])
+
+        if urls:
+            ComboBroadcaster().prefetch(list(dict.fromkeys(urls)))
 
     def _create_combo(self) -> None:
         """Sends the creation message to the browser"""
 
-        if Credentials().emote_manager is not None:
-            emote_string = Credentials().emote_manager.make_emote_string(
-                self._fragments
-            )
-        else:
-            emote_string = [{"type": "text", "value": self.text}]
+        emote_string = self.make_emote_string(self.text, self._fragments)
 
-        CommServer.broadcast(
+        ComboBroadcaster().push(
             {
                 "event": "combo_create",
                 "data": {
+                    "id": self._id,
                     "type": "text",
                     "text": self.text,
                     "combo": self.entries,
@@ -141,14 +494,14 @@ class ChatCombo:
             }
         )
 
-    def _update_combo(self) -> None:
+    def update_combo(self) -> None:
         """Sends the update message to the browser"""
 
-        CommServer.broadcast(
+        ComboBroadcaster().push(
             {
                 "event": "combo_update",
                 "data": {
-                    "text": self.text,
+                    "id": self._id,
                     "combo": self.entries,
                 },
             }
@@ -157,14 +510,14 @@ class ChatCombo:
     def remove_combo(self) -> None:
         """Sends the removal message to the browser"""
 
-        if not self._active:
+        if not self.active:
             return
 
-        CommServer.broadcast(
+        ComboBroadcaster().push(
             {
                 "event": "combo_remove",
                 "data": {
-                    "text": self.text,
+                    "id": self._id,
                 },
             }
         )
@@ -178,6 +531,15 @@ class ChatCombo:
 
         return self._entries
 
+    @property
+    def active(self) -> bool:
+        """
+        Returns:
+            bool: Whether this combo is shown in the widget
+        """
+
+        return self._id is not None
+
     @property
     def expires(self) -> float:
         """
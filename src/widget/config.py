@@ -17,12 +17,22 @@ class Config:
     def _load(self) -> dict[str, Any]:
         """Loads the config from file
 
+        Keys added in newer versions are filled in from the bundled config.
+
         Returns:
             dict[str, Any]: The config data loaded
         """
 
         with open(self.FILE, "r") as rf:
-            return json.loads(rf.read())
+            config = json.loads(rf.read())
+
+        with open(os.path.join(constants.ROOT_DIR, constants.CONFIG_NAME), "r") as rf:
+            defaults = json.loads(rf.read())
+
+        for key, val in defaults.items():
+            config.setdefault(key, val)
+
+        return config
 
     def _write(self) -> None:
         """Writes the config data to file"""
@@ -45,13 +55,14 @@ class Config:
             val = int(val)
 
         self._config[key]["current"] = val
-        from widget.widget_comm import CommServer
+        from widget.widget_comm import CommServer, Topic
 
         CommServer.broadcast(
             {
                 "event": "config_change",
                 "data": {"key": key, "value": val},
-            }
+            },
+            Topic.CONFIG,
         )
 
         self._write()
@@ -100,14 +111,23 @@ class Config:
     def reset_all(self) -> None:
         """Resets all values to their default"""
 
-        for _, i in self._config.items():
+        callbacks = []
+        for key, i in self._config.items():
+            if i["current"] != i["default"]:
+                callback = self._callbacks.get(key, None)
+                if callback and callback not in callbacks:
+                    callbacks.append(callback)
+
             i["current"] = i["default"]
 
         self._write()
 
-        from widget.widget_comm import CommServer
+        from widget.widget_comm import CommServer, Topic
+
+        CommServer.broadcast({"event": "config", "data": self.dump()}, Topic.CONFIG)
 
-        CommServer.broadcast({"event": "config", "data": self.dump()})
+        for callback in callbacks:
+            callback()
 
     def add_change_callback(self, key: str, callback: Callable[[], None]) -> None:
         """Adds a callback which gets called when the value of key changes
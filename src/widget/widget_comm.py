@@ -1,9 +1,17 @@
+from collections import deque
+from enum import Enum
 import json
+from queue import Queue
+import selectors
 import socket
-from threading import Thread
-from typing import Any
+from threading import Lock, Thread
+import time
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
 from wsproto import WSConnection
-from wsproto.connection import ConnectionType
+from wsproto.connection import ConnectionState, ConnectionType
+from wsproto.extensions import PerMessageDeflate
+from wsproto.frame_protocol import FrameProtocol
 from wsproto.events import (
     TextMessage,
     CloseConnection,
@@ -16,85 +24,480 @@ from wsproto.events import (
 
 import constants
 from log import LOG
+from stats import Stats
 from twitch.credentials import Credentials
 from twitch.twitch import TwitchConn
 from widget.config import Config
 
 
+class Topic(Enum):
+    COMBO = "combo"
+    CONFIG = "config"
+    CONNECT = "connect"
+
+
 class CommServer:
-    CONNECTIONS: "set[CommServer]" = set()
-    SEND_QUEUE: list[str] = []
+    # Open connections by the topics they subscribed to
+    CONNECTIONS: "dict[Topic, set[CommServer]]" = {t: set() for t in Topic}
+    CONNECTIONS_LOCK = Lock()
+    # Server frames are unmasked, so one framing serves every connection.
+    # Stateless as long as every message is sent in a single frame.
+    FRAMER = FrameProtocol(client=False, extensions=[])
+    # Compressing framers by negotiated window bits. Without context takeover
+    # every message compresses on its own, so frames are shared just the same.
+    DEFLATERS: dict[int, FrameProtocol] = {}
+    DEFLATERS_LOCK = Lock()
+
+    # Event loop handling all connections, set up by `recv_thread`
+    SELECTOR = selectors.DefaultSelector()
+    # Connections with frames queued by other threads, flushed by the event loop
+    PENDING: "set[CommServer]" = set()
+    PENDING_LOCK = Lock()
+    # Written to by other threads to wake the event loop
+    WAKEUP: Optional[socket.socket] = None
+    # Client messages, handled outside of the event loop as they may block
+    RECEIVED: "Queue[tuple[CommServer, TextMessage]]" = Queue()
+    # Seconds between checks for unresponsive connections
+    HEARTBEAT_TICK = 1.0
 
     @staticmethod
     def recv_thread() -> None:
-        """Starts the receive thread for the communication server"""
+        """Starts the event loop handling all WebSocket connections"""
 
         srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Restarting must not wait for connections closed by the server to expire
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         srv.bind(("127.0.0.1", constants.HTTP_PORT + 1))
-        srv.listen(1)
+        srv.listen(socket.SOMAXCONN)
+        srv.setblocking(False)
+
+        wakeup_recv, CommServer.WAKEUP = socket.socketpair()
+        wakeup_recv.setblocking(False)
+        CommServer.WAKEUP.setblocking(False)
+
+        sel = CommServer.SELECTOR
+        sel.register(srv, selectors.EVENT_READ, None)
+        sel.register(wakeup_recv, selectors.EVENT_READ, None)
+
+        Thread(
+            target=CommServer._handle_thread, name="CommsHandler", daemon=True
+        ).start()
         LOG.info(
             f"WebSocket server running on ws://localhost:{constants.HTTP_PORT + 1}/"
         )
 
+        next_heartbeat = time.time()
+
+        while True:
+            for key, mask in sel.select(CommServer.HEARTBEAT_TICK):
+                if key.fileobj is srv:
+                    CommServer._accept(srv)
+
+                elif key.fileobj is wakeup_recv:
+                    CommServer._drain_wakeup(wakeup_recv)
+
+                else:
+                    obj: CommServer = key.data
+
+                    if mask & selectors.EVENT_READ:
+                        obj._guard(obj._on_readable)
+                    if mask & selectors.EVENT_WRITE:
+                        obj._guard(obj._flush)
+
+            now = time.time()
+            if now >= next_heartbeat:
+                CommServer._heartbeat(now)
+                next_heartbeat = now + CommServer.HEARTBEAT_TICK
+
+    @staticmethod
+    def _accept(srv: socket.socket) -> None:
+        """Accepts all pending connections
+
+        Args:
+            srv (socket.socket): The listening socket
+        """
+
+        while True:
+            try:
+                sock, addr = srv.accept()
+            except BlockingIOError:
+                return
+
+            LOG.info(f"WebSocket incoming from {addr}")
+
+            sock.setblocking(False)
+            obj = CommServer(WSConnection(ConnectionType.SERVER), sock, addr)
+            CommServer.SELECTOR.register(sock, selectors.EVENT_READ, obj)
+
+    @staticmethod
+    def _drain_wakeup(wakeup_recv: socket.socket) -> None:
+        """Flushes all connections other threads queued frames for
+
+        Args:
+            wakeup_recv (socket.socket): The receiving end of the wakeup socket
+        """
+
+        try:
+            while wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        with CommServer.PENDING_LOCK:
+            pending = list(CommServer.PENDING)
+            CommServer.PENDING.clear()
+
+        for obj in pending:
+            obj._guard(obj._flush)
+
+    @staticmethod
+    def _heartbeat(now: float) -> None:
+        """Pings idle connections and evicts unresponsive ones
+
+        Args:
+            now (float): The current time
+        """
+
+        cfg = Config()
+        interval = cfg["ping_interval"]
+        timeout = cfg["ping_timeout"]
+
+        for key in list(CommServer.SELECTOR.get_map().values()):
+            if isinstance(key.data, CommServer):
+                key.data._guard(key.data._check_alive, now, interval, timeout)
+
+    @staticmethod
+    def _handle_thread() -> None:
+        """Starts the thread handling messages received from clients"""
+
         while True:
-            sock, addr = srv.accept()
+            obj, evt = CommServer.RECEIVED.get()
+            obj._recv_msg(evt)
 
-            conn = WSConnection(ConnectionType.SERVER)
-            obj = CommServer(conn, sock)
-            CommServer.CONNECTIONS.add(obj)
+    @staticmethod
+    def connections(topic: Optional[Topic] = None) -> "list[CommServer]":
+        """
+        Args:
+            topic (Optional[Topic], optional): The topic the connections
+                subscribed to. Defaults to None for all connections.
+
+        Returns:
+            list[CommServer]: A snapshot of the open connections
+        """
+
+        with CommServer.CONNECTIONS_LOCK:
+            if topic is not None:
+                return list(CommServer.CONNECTIONS[topic])
 
-            Thread(
-                target=obj.handle, args=(addr,), name="CommsConnection", daemon=True
-            ).start()
+            return list(set().union(*CommServer.CONNECTIONS.values()))
 
     @staticmethod
-    def broadcast(message: dict[str, Any]) -> None:
-        """Broadcasts the given message to all connected WebSockets
+    def broadcast(
+        message: dict[str, Any], topic: Topic, droppable: bool = False
+    ) -> None:
+        """Broadcasts the given message to all WebSockets subscribed to its topic
+
+        Never blocks, the message is only queued for every connection.
 
         Args:
             message (dict[str, Any]): The message to broadcast
+            topic (Topic): The topic of the message
+            droppable (bool, optional): Whether slow connections may skip the
+                message because a later one supersedes it. Defaults to False.
         """
 
-        data_msg = json.dumps(message)
-        for connection in CommServer.CONNECTIONS:
-            connection.send(data_msg)
+        connections = CommServer.connections(topic)
+        if not connections:
+            return
+
+        payload = json.dumps(message)
+        frames: dict[Optional[int], bytes] = {}
+        raw = sent = 0
+
+        for connection in connections:
+            bits = connection._deflate_bits
+            frame = frames.get(bits)
+            if frame is None:
+                frame = frames[bits] = CommServer._frame(payload, bits)
+
+            connection.send_frame(frame, droppable)
+            raw += len(payload)
+            sent += len(frame)
+
+        if raw:
+            Stats().incr("comms_bytes_raw", raw)
+            Stats().incr("comms_bytes_sent", sent)
+
+    @staticmethod
+    def _frame(payload: str, bits: Optional[int]) -> bytes:
+        """Frames a message, compressing it if worthwhile
+
+        Args:
+            payload (str): The message to frame
+            bits (Optional[int]): The negotiated deflate window bits, None if
+                the client does not support compression
+
+        Returns:
+            bytes: The WebSocket frame
+        """
+
+        if bits is None or len(payload) < constants.COMMS_DEFLATE_THRESHOLD:
+            return CommServer.FRAMER.send_data(payload)
+
+        with CommServer.DEFLATERS_LOCK:
+            framer = CommServer.DEFLATERS.get(bits)
+            if framer is None:
+                deflate = PerMessageDeflate()
+                deflate.finalize(
+                    "permessage-deflate; server_no_context_takeover; "
+                    f"server_max_window_bits={bits}"
+                )
+                framer = FrameProtocol(client=False, extensions=[deflate])
+                CommServer.DEFLATERS[bits] = framer
+
+            return framer.send_data(payload)
 
     @staticmethod
     def close_all() -> None:
-        """Closes all open connections"""
+        """Closes all open connections, waiting shortly for them to finish"""
 
-        for connection in CommServer.CONNECTIONS:
+        for connection in CommServer.connections():
             connection.close()
 
-    def __init__(self, conn: WSConnection, sock: socket.socket):
+        deadline = time.time() + 1.0
+        while CommServer.connections() and time.time() < deadline:
+            time.sleep(0.05)
+
+    def __init__(
+        self, conn: WSConnection, sock: socket.socket, peername: tuple[str, int]
+    ):
         self._conn = conn
         self._sock = sock
+        self._peername = peername
         self._closing: bool = False
+        self._closed: bool = False
+        # Window bits of permessage-deflate if negotiated
+        self._deflate_bits: Optional[int] = None
+        self._topics: set[Topic] = set(Topic)
+
+        # Frames waiting to be written, with whether they may be dropped
+        self._outbox: deque[tuple[bytes, bool]] = deque()
+        self._outbox_lock = Lock()
+        self._writing: bool = False
 
-    def send(self, message: str) -> None:
-        """Sends a message to the current WebSocket
+        # Liveness, only touched by the event loop
+        self._last_seen = time.time()
+        self._ping_sent: Optional[float] = None
+        self._stalled_since: Optional[float] = None
+
+    def send(self, message: str, droppable: bool = False) -> None:
+        """Queues a message to be sent to the current WebSocket
 
         Args:
             message (str): The message to send
+            droppable (bool, optional): Whether the message may be dropped when
+                the connection falls behind. Defaults to False.
+        """
+
+        frame = CommServer._frame(message, self._deflate_bits)
+        Stats().incr("comms_bytes_raw", len(message))
+        Stats().incr("comms_bytes_sent", len(frame))
+
+        self.send_frame(frame, droppable)
+
+    def send_frame(self, frame: bytes, droppable: bool = False) -> None:
+        """Queues an already framed message to be sent to the current WebSocket
+
+        Args:
+            frame (bytes): The WebSocket frame to send
+            droppable (bool, optional): Whether the frame may be dropped when
+                the connection falls behind. Defaults to False.
         """
 
-        self._sock.sendall(self._conn.send(TextMessage(message)))
+        with self._outbox_lock:
+            if self._closed:
+                return
+
+            self._enqueue(frame, droppable)
+
+        self._request_flush()
 
-    def handle(self, peername: tuple[str, int]) -> None:
-        """Handles the current WebSocket connection
+    def _enqueue(self, data: bytes, droppable: bool) -> None:
+        """Queues a frame, handling connections falling behind
+
+        When the queue is full the oldest droppable frame is discarded. A
+        connection with nothing left to drop gets disconnected. The outbox
+        lock must be held.
 
         Args:
-            peername (tuple[str, int]): The peername the connection comes from
+            data (bytes): The frame to send
+            droppable (bool): Whether the frame may be dropped later on
+        """
+
+        if len(self._outbox) >= constants.COMMS_SEND_QUEUE:
+            for i, (_, old_droppable) in enumerate(self._outbox):
+                if old_droppable:
+                    del self._outbox[i]
+                    Stats().incr("comms_dropped")
+                    break
+            else:
+                LOG.warning("WebSocket client too slow, disconnecting")
+                Stats().incr("comms_evicted")
+                self._closed = True
+                self._outbox.clear()
+                return
+
+        self._outbox.append((data, droppable))
+
+    def _request_flush(self) -> None:
+        """Makes the event loop flush the outbox of the current connection"""
+
+        with CommServer.PENDING_LOCK:
+            wake = not CommServer.PENDING
+            CommServer.PENDING.add(self)
+
+        if wake and CommServer.WAKEUP is not None:
+            try:
+                CommServer.WAKEUP.send(b"\0")
+            except BlockingIOError:
+                pass  # The event loop is already being woken up
+
+    def _flush(self) -> None:
+        """Writes as many queued frames as the socket accepts without blocking
+
+        Only called from the event loop.
         """
 
-        LOG.info(f"WebSocket incoming from {peername}")
+        with self._outbox_lock:
+            progressed = False
+
+            while self._outbox:
+                data, _ = self._outbox[0]
+
+                try:
+                    sent = self._sock.send(data)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    self._closed = True
+                    self._outbox.clear()
+                    break
+
+                progressed = progressed or sent > 0
+
+                if sent < len(data):
+                    # A partially written frame must be completed, never dropped
+                    self._outbox[0] = (data[sent:], False)
+                    # Only a client accepting nothing at all counts as stalled
+                    if progressed or self._stalled_since is None:
+                        self._stalled_since = time.time()
+                    break
+
+                self._outbox.popleft()
+
+            waiting = bool(self._outbox)
+            if not waiting:
+                self._stalled_since = None
+            finished = self._closed and not waiting
+
+        if finished:
+            self._finish()
+        elif waiting != self._writing:
+            self._writing = waiting
+            mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if waiting else 0)
+            CommServer.SELECTOR.modify(self._sock, mask, self)
+
+    def _finish(self) -> None:
+        """Closes the socket and forgets the connection
+
+        Only called from the event loop.
+        """
+
+        if self._sock.fileno() == -1:
+            return
+
+        LOG.info(f"WebSocket closed for {self._peername}")
+
+        with CommServer.CONNECTIONS_LOCK:
+            for connections in CommServer.CONNECTIONS.values():
+                connections.discard(self)
+
+        CommServer.SELECTOR.unregister(self._sock)
+        self._sock.close()
+
+    def _check_alive(self, now: float, interval: float, timeout: float) -> None:
+        """Pings the client when idle, evicting it if it stopped responding
+
+        A client is unresponsive when it did not answer a ping or did not
+        accept any data written to it within the timeout.
+
+        Args:
+            now (float): The current time
+            interval (float): Seconds of silence after which to ping the client
+            timeout (float): Seconds to wait for the client
+        """
+
+        if self._stalled_since is not None and now - self._stalled_since > timeout:
+            self._evict("not reading")
+
+        elif self._ping_sent is not None and now - self._ping_sent > timeout:
+            self._evict("not answering pings")
+
+        elif self._conn.state != ConnectionState.OPEN:
+            if now - self._last_seen > timeout:
+                self._evict("not finishing the handshake")
+
+        elif self._ping_sent is None and now - self._last_seen >= interval:
+            self._ping_sent = now
+            self._send_event(Ping())
+
+    def _guard(self, handler: Callable[..., None], *args: Any) -> None:
+        """Runs a handler of the event loop, dropping the connection if it fails
+
+        A misbehaving client, like a browser sending plain HTTP, must only
+        take down its own connection and never the event loop.
+
+        Args:
+            handler (Callable[..., None]): The handler to run
+            *args (Any): The arguments to pass to the handler
+        """
 
         try:
-            self._read()
-        finally:
-            LOG.info(f"WebSocket closed for {peername}")
-            CommServer.CONNECTIONS.remove(self)
-            self._sock.close()
+            handler(*args)
+        except Exception:
+            LOG.exception(f"WebSocket client {self._peername} failed, disconnecting")
+            Stats().incr("comms_failed")
+
+            with self._outbox_lock:
+                self._closed = True
+                self._outbox.clear()
+
+            self._finish()
+
+    def _evict(self, reason: str) -> None:
+        """Drops an unresponsive connection
+
+        Only called from the event loop.
+
+        Args:
+            reason (str): Why the connection is dropped
+        """
+
+        LOG.warning(f"WebSocket client {self._peername} {reason}, disconnecting")
+        Stats().incr("comms_timed_out")
+
+        with self._outbox_lock:
+            self._closed = True
+            self._outbox.clear()
+
+        self._finish()
+
+    def register(self) -> None:
+        """Starts broadcasting the subscribed topics to the current connection"""
+
+        with CommServer.CONNECTIONS_LOCK:
+            for topic in self._topics:
+                CommServer.CONNECTIONS[topic].add(self)
 
     def close(self) -> None:
         """Closes the current connection"""
@@ -102,44 +505,96 @@ class CommServer:
         self._send_event(CloseConnection(1000, "Closing connection."))
         self._closing = True
 
-    def _read(self) -> None:
-        """Reads data from the WebSocket and handles it"""
+    def _on_readable(self) -> None:
+        """Reads data from the WebSocket and handles it
 
-        while True:
+        Only called from the event loop.
+        """
+
+        try:
             data = self._sock.recv(4096)
-            if not data:
-                break
-
-            self._conn.receive_data(data)
-
-            for event in self._conn.events():
-                if isinstance(event, CloseConnection):
-                    if not self._closing:
-                        self._send_event(CloseConnection(event.code, event.reason))
-                    self._sock.close()
-                    return
-
-                elif isinstance(event, TextMessage):
-                    self._recv_msg(event)
-
-                elif isinstance(event, Ping):
-                    self._send_event(Pong(event.payload))
-
-                elif isinstance(event, Request):
-                    self._send_event(
-                        AcceptConnection(),
-                        TextMessage(
-                            json.dumps({"event": "config", "data": Config().dump()})
-                        ),
-                        TextMessage(
-                            json.dumps(
-                                {
-                                    "event": "connect",
-                                    "data": {"connected": TwitchConn().connected},
-                                }
-                            )
-                        ),
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        self._last_seen = time.time()
+        self._ping_sent = None
+
+        if not data:
+            # Let what is left, like the reply to a close, be written first
+            with self._outbox_lock:
+                self._closed = True
+            self._flush()
+            return
+
+        self._conn.receive_data(data)
+
+        for event in self._conn.events():
+            if isinstance(event, CloseConnection):
+                if not self._closing:
+                    self._send_event(CloseConnection(event.code, event.reason))
+
+                with self._outbox_lock:
+                    self._closed = True
+                self._flush()
+                return
+
+            elif isinstance(event, TextMessage):
+                CommServer.RECEIVED.put((self, event))
+
+            elif isinstance(event, Ping):
+                self._send_event(Pong(event.payload))
+
+            elif isinstance(event, Request):
+                self._accept_request(event)
+
+    def _accept_request(self, request: Request) -> None:
+        """Accepts the handshake, sending the current state of the subscribed topics
+
+        Clients subscribe to topics by a comma separated `topics` parameter in
+        the URL, without one they receive all topics.
+
+        Args:
+            request (Request): The handshake request of the client
+        """
+
+        query = parse_qs(urlsplit(request.target).query)
+        if "topics" in query:
+            names = ",".join(query["topics"]).split(",")
+            self._topics = {t for t in Topic if t.value in names}
+
+        deflate = PerMessageDeflate(server_no_context_takeover=True)
+        events: list[Event] = [AcceptConnection(extensions=[deflate])]
+
+        if Topic.CONFIG in self._topics:
+            events.append(
+                TextMessage(json.dumps({"event": "config", "data": Config().dump()}))
+            )
+
+        if Topic.CONNECT in self._topics:
+            events.append(
+                TextMessage(
+                    json.dumps(
+                        {
+                            "event": "connect",
+                            "data": {"connected": TwitchConn().connected},
+                        }
                     )
+                )
+            )
+
+        self._send_event(*events)
+
+        if deflate.enabled():
+            self._deflate_bits = deflate.server_max_window_bits
+
+        if Topic.COMBO in self._topics:
+            from widget.broadcast import ComboBroadcaster
+
+            ComboBroadcaster().send_snapshot(self, register=True)
+        else:
+            self.register()
 
     def _recv_msg(self, evt: TextMessage) -> None:
         """Callback for receiving text messages
@@ -164,12 +619,22 @@ class CommServer:
             elif event == "shutdown":
                 Credentials().shutdown.set()
 
+            elif event == "snapshot":
+                from widget.broadcast import ComboBroadcaster
+
+                ComboBroadcaster().send_snapshot(self)
+
         except Exception:
             pass
 
     def _send_event(self, *event: Event) -> None:
-        """Sends an event to the current WebSocket"""
+        """Queues events to be sent to the current WebSocket"""
+
+        with self._outbox_lock:
+            if self._closed:
+                return
+
+            for e in event:
+                self._enqueue(self._conn.send(e), False)
 
-        for e in event:
-            data = self._conn.send(e)
-            self._sock.sendall(data)
+        self._request_flush()
@@ -33,6 +33,7 @@ const changelistener = (ev) => {
 
   for (const key of Object.keys(config)) {
     const el = document.getElementById(key);
+    if (el === null) continue;
 
     if (String(el.value) !== String(config[key])) {
       if (typeof config[key] === "boolean") {
@@ -77,7 +78,9 @@ const reloadTest = () => {
  * @returns The socket connected to the backend
  */
 const connectSock = () => {
-  const s = new WebSocket("ws://localhost:{{WS_PORT}}/");
+  const s = new WebSocket(
+    "ws://localhost:{{WS_PORT}}/?topics=config,connect"
+  );
 
   s.addEventListener("message", (ev) => {
     const msg = JSON.parse(ev.data);
@@ -90,6 +93,7 @@ const connectSock = () => {
       for (const key of Object.keys(conf)) {
         const el = document.getElementById(key);
         config[key] = conf[key];
+        if (el === null) continue;
 
         if (typeof key === "boolean") el.checked = conf[key];
         else el.value = conf[key];
@@ -97,6 +101,7 @@ const connectSock = () => {
     } else if (msg.event === "config_change") {
       const el = document.getElementById(msg.data.key);
       config[msg.data.key] = msg.data.value;
+      if (el === null) return;
 
       if (typeof msg.data.key === "boolean") el.checked = conf[msg.data.key];
       else el.value = msg.data.value;
@@ -1,7 +1,11 @@
 const msgList = document.getElementById("messages");
 const notification = document.getElementById("notification");
 
-const activeCombos = {};
+const activeCombos = new Map();
+// Sequence number of the last combo batch applied
+let lastSeq = 0;
+// Whether batches are skipped until a requested snapshot arrives
+let resyncing = false;
 
 /**
  * Plays a bounce animation on the element
@@ -44,6 +48,18 @@ const createEmoteString = (emoteStr, emoteEl) => {
   }
 };
 
+/**
+ * Loads the emotes of a combo about to be shown into the image cache
+ * @param {{}} msg The message holding the emote urls
+ */
+const prefetchEmotes = (msg) => {
+  for (const url of msg.data.urls) {
+    const img = new Image();
+    img.src = url;
+    img.decode().catch(() => {});
+  }
+};
+
 /**
  * Creates a combo for the given message
  * @param {string} msg The message
@@ -54,7 +70,7 @@ const createCombo = (msg) => {
   const combo = document.createElement("span");
 
   createEmoteString(msg.data.emote, text);
-  el.dataset["text"] = msg.data.text;
+  el.dataset["id"] = msg.data.id;
   combo.innerText = `x${msg.data.combo}`;
 
   text.classList.add("text");
@@ -64,20 +80,20 @@ const createCombo = (msg) => {
   el.appendChild(combo);
   msgList.appendChild(el);
 
-  activeCombos[msg.data.text] = {
+  activeCombos.set(msg.data.id, {
     comboEl: combo,
     rootEl: el,
-  };
+  });
 
   bounce(el);
 };
 
 /**
  * Updates the count of a combo
- * @param {string} msg The message to update
+ * @param {{}} msg The message holding the combo id and count
  */
 const updateCombo = (msg) => {
-  const combo = activeCombos[msg.data.text];
+  const combo = activeCombos.get(msg.data.id);
   if (combo === undefined) return;
 
   combo.comboEl.innerText = `x${msg.data.combo}`;
@@ -87,10 +103,10 @@ const updateCombo = (msg) => {
 
 /**
  * Removes a combo message
- * @param {string} msg The message to remove
+ * @param {{}} msg The message holding the combo id
  */
 const removeCombo = (msg) => {
-  const combo = activeCombos[msg.data.text];
+  const combo = activeCombos.get(msg.data.id);
   if (combo === undefined) return;
 
   combo.rootEl.animate(
@@ -100,7 +116,58 @@ const removeCombo = (msg) => {
 
   setTimeout(() => msgList.removeChild(combo.rootEl), 200);
 
-  delete activeCombos[msg.data.text];
+  activeCombos.delete(msg.data.id);
+};
+
+/**
+ * Removes all combos
+ */
+const clearCombos = () => {
+  for (const id of [...activeCombos.keys()]) {
+    removeCombo({ data: { id: id } });
+  }
+};
+
+/**
+ * Replaces all combos with the ones in the snapshot
+ * @param {{}} msg The snapshot of all active combos
+ */
+const applySnapshot = (msg) => {
+  clearCombos();
+  msg.data.forEach((data) => createCombo({ data: data }));
+
+  lastSeq = msg.seq;
+  resyncing = false;
+};
+
+/**
+ * Applies a batch of combo events, requesting a snapshot if batches were missed
+ * @param {{}} msg The batch to apply
+ */
+const applyBatch = (msg) => {
+  if (resyncing) return;
+
+  if (msg.seq > lastSeq + 1) {
+    resyncing = true;
+    sock.send(JSON.stringify({ event: "snapshot" }));
+    return;
+  }
+
+  msg.data.forEach(handleMessage);
+  lastSeq = msg.seq;
+};
+
+/**
+ * Handles a message received from the backend
+ * @param {{}} msg The message to handle
+ */
+const handleMessage = (msg) => {
+  if (msg.event === "batch") applyBatch(msg);
+  else if (msg.event === "snapshot") applySnapshot(msg);
+  else if (msg.event === "combo_create") createCombo(msg);
+  else if (msg.event === "combo_update") updateCombo(msg);
+  else if (msg.event === "combo_remove") removeCombo(msg);
+  else if (msg.event === "combo_prefetch") prefetchEmotes(msg);
 };
 
 /**
@@ -119,19 +186,14 @@ const reloadTest = () => {
  * @returns The connected WebSocket
  */
 const connect = () => {
-  const s = new WebSocket("ws://localhost:{{WS_PORT}}/");
+  const s = new WebSocket("ws://localhost:{{WS_PORT}}/?topics=combo");
   s.addEventListener("message", (event) => {
-    const msg = JSON.parse(event.data);
-
-    if (msg.event === "combo_create") createCombo(msg);
-    else if (msg.event === "combo_update") updateCombo(msg);
-    else if (msg.event === "combo_remove") removeCombo(msg);
+    handleMessage(JSON.parse(event.data));
   });
 
   s.addEventListener("close", () => {
-    for (const c of Object.keys(activeCombos)) {
-      removeCombo({ data: { text: c } });
-    }
+    clearCombos();
+    resyncing = false;
 
     notification.animate(
       { transform: "translateX(0px)" },